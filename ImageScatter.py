@@ -1,13 +1,317 @@
+from collections import OrderedDict
+import os
+import threading
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib import artist as martist
 from matplotlib.offsetbox import OffsetImage, AnnotationBbox
 from matplotlib.legend_handler import HandlerBase
+from matplotlib.lines import Line2D
 from matplotlib.image import BboxImage
 from matplotlib.transforms import TransformedBbox, Bbox
 
 
+def to_rgba(data):
+    """Image data (grey, RGB or RGBA, floats or uint8) as RGBA floats between 0 and 1"""
+    data = np.asarray(data)
+    if data.dtype == np.uint8:
+        data = data / 255
+    if data.ndim == 2:
+        data = np.stack([data] * 3, axis=-1)
+    if data.shape[2] == 3:
+        data = np.concatenate([data, np.ones(data.shape[:2] + (1,))], axis=2)
+    return data.astype(np.float32, copy=False)
+
+
+def resize_image(data, width, height):
+    """Resamples RGBA float data to width x height pixels (Pillow averages over the pixels when shrinking)"""
+    from PIL import Image
+    image = Image.fromarray((np.clip(data, 0, 1) * 255).round().astype(np.uint8), "RGBA")
+    return np.asarray(image.resize((width, height), Image.LANCZOS), dtype=np.float32) / 255
+
+
+def crop_to_square(rgba):
+    """The RGBA image cropped to the pixels that are not transparent, padded with transparent pixels to a square"""
+    visible = rgba[..., 3] > 0
+    rows = np.flatnonzero(visible.any(axis=1))
+    cols = np.flatnonzero(visible.any(axis=0))
+    if len(rows) == 0:
+        return rgba
+    data = rgba[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    nrows, ncols = data.shape[:2]
+    size = max(nrows, ncols)
+    square = np.zeros((size, size, 4), dtype=rgba.dtype)
+    top, left = (size - nrows) // 2, (size - ncols) // 2
+    square[top:top + nrows, left:left + ncols] = data
+    return square
+
+
+def half_size(rgba):
+    """The RGBA image at half the size, every pixel the average of 2x2 pixels (weighted by alpha)"""
+    if rgba.shape[0] % 2 or rgba.shape[1] % 2:
+        rgba = np.pad(rgba, ((0, rgba.shape[0] % 2), (0, rgba.shape[1] % 2), (0, 0)), mode="edge")
+    premultiplied = np.concatenate([rgba[..., :3] * rgba[..., 3:], rgba[..., 3:]], axis=-1)
+    blocks = premultiplied.reshape(rgba.shape[0] // 2, 2, rgba.shape[1] // 2, 2, 4).mean(axis=(1, 3))
+    alpha = blocks[..., 3:]
+    rgb = np.divide(blocks[..., :3], alpha, out=np.zeros_like(blocks[..., :3]), where=alpha > 0)
+    return np.concatenate([rgb, alpha], axis=-1)
+
+
+class PreparedImage:
+    """
+    An image with what is needed to use it as a marker, worked out once (the first time it is needed):
+    square: the image cropped to what is not transparent and padded to a square, for the legend
+    levels: mipmap pyramid, the image at full, half, a quarter, ... of the size, so a small marker is resampled
+            from the level closest to its size instead of from the full image every draw
+    """
+    min_size = 4  # Smallest size of a level in pixels
+
+    def __init__(self, data):
+        self.data = data
+        self._rgba = None
+        self._square = None
+        self._levels = None
+
+    @property
+    def rgba(self):
+        if self._rgba is None:
+            self._rgba = to_rgba(self.data)
+        return self._rgba
+
+    @property
+    def square(self):
+        if self._square is None:
+            self._square = crop_to_square(self.rgba)
+            self._square.flags.writeable = False
+        return self._square
+
+    @property
+    def levels(self):
+        if self._levels is None:
+            levels = [self.rgba]
+            while min(levels[-1].shape[:2]) >= 2 * self.min_size:
+                levels.append(half_size(levels[-1]))
+                levels[-1].flags.writeable = False
+            self._levels = levels
+        return self._levels
+
+    @property
+    def mean_color(self):
+        """The average color of the visible pixels, for a point that stands in for the image"""
+        smallest = self.levels[-1].reshape(-1, 4)
+        weights = smallest[:, 3]
+        if weights.sum() == 0:
+            return 0.5, 0.5, 0.5
+        return tuple(float(value) for value in np.clip(np.average(smallest[:, :3], axis=0, weights=weights), 0, 1))
+
+    def level(self, width, height):
+        """The smallest level that is at least width x height pixels (the full image to scale it up)"""
+        for level in self.levels[::-1]:
+            if level.shape[1] >= width and level.shape[0] >= height:
+                return level
+        return self.levels[0]
+
+    @property
+    def nbytes(self):
+        parts = [self.data] + ([] if self._levels is None else self._levels[1:])
+        parts += [part for part in (self._square,) if part is not None]
+        if self._rgba is not None and self._rgba is not self.data:
+            parts.append(self._rgba)
+        return sum(np.asarray(part).nbytes for part in parts)
+
+
+class ImageCache:
+    """
+    The decoded images of files, so the same file is only read (and prepared, see PreparedImage) once. The least
+    recently used images are thrown away when the images together get bigger than max_bytes. A file that changed
+    (modification time or size) is read again.
+    The arrays are read only, because everybody who loads the same file gets the same array.
+    """
+    def __init__(self, max_bytes=256e6):
+        self.max_bytes = max_bytes
+        self.images = OrderedDict()  # (path, modification time, size): PreparedImage, least recently used first
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def nbytes(self):
+        return sum(image.nbytes for image in self.images.values())
+
+    @staticmethod
+    def key(path):
+        stat = os.stat(path)
+        return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+    def prepare(self, path):
+        """
+        The PreparedImage of a file.
+        :param path: Path of the image file, other things plt.imread can read (file objects, urls) are not cached
+        """
+        if not isinstance(path, (str, os.PathLike)):
+            return PreparedImage(plt.imread(path))
+        key = self.key(path)
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+                self.hits += 1
+                return image
+        data = plt.imread(path)
+        data.flags.writeable = False
+        image = PreparedImage(data)
+        with self.lock:
+            self.misses += 1
+            # An older version of the file is not needed anymore
+            for old in [old for old in self.images if old[0] == key[0]]:
+                del self.images[old]
+            self.images[key] = image
+            while len(self.images) > 1 and self.nbytes > self.max_bytes:
+                self.images.popitem(last=False)
+        return image
+
+    def load(self, path):
+        """The decoded image of a file, like plt.imread(path)"""
+        return self.prepare(path).data
+
+    def clear(self):
+        with self.lock:
+            self.images = OrderedDict()
+
+
+# Shared by everything that loads images in this process
+image_cache = ImageCache()
+
+
+class MipmapImage(OffsetImage):
+    """
+    OffsetImage that is drawn from the level of the mipmap pyramid (see PreparedImage) closest to the size it is
+    drawn at, instead of from the full image.
+    """
+    def __init__(self, prepared, zoom=0.05, **kwargs):
+        super().__init__(prepared.data, zoom=zoom, **kwargs)
+        self.prepared = prepared
+        self.level = None
+
+    def draw(self, renderer):
+        bbox = self.get_bbox(renderer)
+        level = self.prepared.level(bbox.width, bbox.height)
+        if level is not self.level:
+            self.image.set_data(level)
+            self.level = level
+        super().draw(renderer)
+
+
 def getImage(path, zoom=0.05):
-    return OffsetImage(plt.imread(path), zoom=zoom)
+    return MipmapImage(image_cache.prepare(path), zoom=zoom)
+
+
+class PointIndex:
+    """
+    The points sorted by x, to quickly find the ones inside the view limits when zoomed in.
+    """
+    def __init__(self, x, y):
+        self.x = np.asarray(x, dtype=float).ravel()
+        self.y = np.asarray(y, dtype=float).ravel()
+        self.order = np.argsort(self.x, kind="stable")
+        self.sorted_x = self.x[self.order]
+
+    def __len__(self):
+        return len(self.x)
+
+    def inside(self, xlim, ylim, margin=0.):
+        """
+        The indices of the points inside the limits, in the original order (the order they are drawn in).
+        :param margin: Also the points this fraction of the limits outside of them
+        """
+        x0, x1 = sorted(xlim)
+        y0, y1 = sorted(ylim)
+        x0, x1 = x0 - margin * (x1 - x0), x1 + margin * (x1 - x0)
+        y0, y1 = y0 - margin * (y1 - y0), y1 + margin * (y1 - y0)
+        start = np.searchsorted(self.sorted_x, x0, side="left")
+        end = np.searchsorted(self.sorted_x, x1, side="right")
+        candidates = self.order[start:end]
+        y = self.y[candidates]
+        return np.sort(candidates[(y >= y0) & (y <= y1)])
+
+
+class SpriteScatter(martist.Artist):
+    """
+    All copies of one image marker as a single artist. The image is scaled once for the resolution it is drawn at
+    (a sprite), and every draw the sprite is blitted at the display position of each point in one go. Much cheaper
+    than an AnnotationBbox per point (with its own OffsetImage, transforms and resampling) when there are many points.
+    Like an AnnotationBbox, only points inside the axes are drawn (but their image may stick out of the axes).
+    """
+    zorder = 3  # The same as AnnotationBbox
+
+    def __init__(self, data, offsets, zoom=0.05, **kwargs):
+        """
+        :param data: The image data (anything plt.imshow can show), or a PreparedImage
+        :param offsets: Array (N, 2) with the x, y data coordinates of the points
+        :param zoom: Scaling of the image, like OffsetImage
+        """
+        super().__init__()
+        self.prepared = data if isinstance(data, PreparedImage) else PreparedImage(data)
+        self._data = self.prepared.data
+        self.offsets = np.asarray(offsets, dtype=float).reshape(-1, 2)
+        self.index = PointIndex(self.offsets[:, 0], self.offsets[:, 1])
+        self.zoom = zoom
+        self.sprites = {}  # size in pixels: sprite
+        # Not cut off at the edge of the axes, like an AnnotationBbox
+        self.set_clip_on(False)
+        # For vector formats the sprites are still painted into a raster image, at the dpi of the figure
+        self.set_rasterized(True)
+        self.update(kwargs)
+
+    def get_data(self):
+        return self._data
+
+    def get_zoom(self):
+        return self.zoom
+
+    def set_offsets(self, offsets):
+        self.offsets = np.asarray(offsets, dtype=float).reshape(-1, 2)
+        self.index = PointIndex(self.offsets[:, 0], self.offsets[:, 1])
+        self.stale = True
+
+    def sprite_size(self, renderer):
+        """The size of the sprite in pixels, the same as an OffsetImage with the same zoom"""
+        scale = self.zoom * renderer.points_to_pixels(1.)
+        height, width = self.prepared.data.shape[:2]
+        return max(int(round(width * scale)), 1), max(int(round(height * scale)), 1)
+
+    def sprite(self, size):
+        """The image scaled to size (width, height) as RGBA uint8, with row 0 at the bottom like renderer.draw_image"""
+        if size not in self.sprites:
+            scaled = resize_image(self.prepared.level(*size), *size)[::-1]
+            # Only the last size, it only changes with the dpi
+            self.sprites = {size: np.ascontiguousarray((scaled * 255).round().astype(np.uint8))}
+        return self.sprites[size]
+
+    def visible_offsets(self):
+        """The points that are drawn (the ones inside the view limits), in display coordinates"""
+        inside = self.index.inside(self.axes.get_xlim(), self.axes.get_ylim())
+        return self.axes.transData.transform(self.offsets[inside])
+
+    @martist.allow_rasterization
+    def draw(self, renderer):
+        if not self.get_visible() or len(self.offsets) == 0:
+            return
+        size = self.sprite_size(renderer)
+        sprite = self.sprite(size)
+        xy = self.visible_offsets()
+        if len(xy) == 0:
+            return
+        # The lower left corner of each sprite, centered on the point like an AnnotationBbox
+        corners = np.floor(xy - np.array(size) / 2 + 0.5).astype(int).tolist()
+        gc = renderer.new_gc()
+        self._set_gc_clip(gc)
+        gc.set_alpha(self.get_alpha())
+        draw_image = renderer.draw_image
+        for x, y in corners:
+            draw_image(gc, x, y, sprite)
+        gc.restore()
+        self.stale = False
 
 
 class ImgHandler(HandlerBase):
@@ -21,9 +325,9 @@ class ImgHandler(HandlerBase):
         # make the image bigger by increasing the scale:
         # The location or the images in the legend can become weird then though.
         scale = 1
-        # Get data from the image
-        img_data = orig_handle._data
-        img_data = self.crop_img_data(img_data)
+        # Get data from the image, cropped and made square (only done once for each image)
+        prepared = getattr(orig_handle, "prepared", None)
+        img_data = self.crop_img_data(orig_handle.get_data()) if prepared is None else prepared.square
         # Get the shape to determine the aspect ratio of the image used
         ratio = img_data.shape[0] / img_data.shape[1]
         other_ratio = width / height
@@ -46,22 +350,67 @@ class ImgHandler(HandlerBase):
 
     @staticmethod
     def crop_img_data(data):
-        """Crops empty part of the image out"""
-        rows_sel = np.sum(np.sum(data, axis=1), axis=1) > 0
-        cols_sel = np.sum(np.sum(data, axis=0), axis=1) > 0
-        data = data[rows_sel]
-        data = data[:,cols_sel]
-        nrows = np.sum(rows_sel)
-        ncols = np.sum(cols_sel)
-        if ncols > nrows:
-            diff = ncols - nrows
-            add = np.zeros((diff // 2, ncols, 4))
-            data = np.concatenate((add, data, add), axis=0)
-        elif nrows > ncols:
-            diff = nrows - ncols
-            add = np.zeros((nrows, diff // 2, 4))
-            data = np.concatenate((add, data, add), axis=1)
-        return data
+        """Crops empty part of the image out, and pads it to a square"""
+        return crop_to_square(to_rgba(data))
+
+
+class MarkerGroup:
+    """
+    The markers of one ImageScatter.scatter call. Only the images of the points inside the view limits are shown, and
+    when they would cover the axes more than max_density times over (zoomed out far), a cheap point in the average
+    color of the image is shown for every point instead.
+    """
+    def __init__(self, ax, x, y, prepared, zoom, boxes=None, sprites=None, point_size=3):
+        """
+        :param prepared: The PreparedImage of the image
+        :param boxes: List with an AnnotationBbox per point, or
+        :param sprites: The SpriteScatter of the points
+        :param point_size: Size of the points that replace the images (in points)
+        """
+        self.ax = ax
+        self.index = PointIndex(x, y)
+        self.prepared = prepared
+        self.zoom = zoom
+        self.boxes = boxes
+        self.sprites = sprites
+        self.shown = np.ones(len(self.index), dtype=bool)  # The boxes that are visible
+        self.points = Line2D(self.index.x, self.index.y, ls="", marker="o", ms=point_size, mew=0,
+                             color=prepared.mean_color, label="_nolegend_", visible=False, zorder=3)
+        ax.add_artist(self.points)  # Not add_line, like the images the points do not change the data limits
+        self.simplified = False
+
+    def radius(self):
+        """Distance from a point (in pixels) within which the cursor is on its marker"""
+        if self.simplified:
+            return self.points.get_markersize() * self.ax.figure.dpi / 72 / 2
+        height, width = self.prepared.data.shape[:2]
+        return max(width, height) * self.zoom * self.ax.figure.dpi / 72 / 2
+
+    def density(self, n_points):
+        """How many times over n_points images cover the axes"""
+        height, width = self.prepared.data.shape[:2]
+        pixels = self.zoom * self.ax.figure.dpi / 72
+        return n_points * width * height * pixels ** 2 / max(self.ax.bbox.width * self.ax.bbox.height, 1)
+
+    def update_view(self, max_density=None):
+        """Shows the markers for the current view limits"""
+        # An AnnotationBbox checks itself if it is inside the axes (with some tolerance), only clearly hidden boxes
+        # are left out
+        inside = self.index.inside(self.ax.get_xlim(), self.ax.get_ylim(), margin=0.01 if self.boxes else 0.)
+        simplified = max_density is not None and self.density(len(inside)) > max_density
+        if simplified != self.simplified:
+            self.points.set_visible(simplified)
+            if self.sprites is not None:
+                self.sprites.set_visible(not simplified)
+            self.simplified = simplified
+        if self.boxes is not None:
+            shown = np.zeros(len(self.index), dtype=bool)
+            if not simplified:
+                shown[inside] = True
+            # Only the boxes that appear or disappear are touched
+            for i in np.flatnonzero(shown != self.shown):
+                self.boxes[i].set_visible(shown[i])
+            self.shown = shown
 
 
 class ImageScatter:
@@ -75,17 +424,38 @@ class ImageScatter:
     fig, ax = plt.subplots()
     img_ax = ImageScatter(ax)
     img_ax.scatter(x, y, img_path, label="label")
+    # For thousands of points, all copies of the image can be drawn by a single artist:
+    img_ax.scatter(x_many, y_many, img_path, label="many", sprites=True)
+
+    # Images outside the view limits are skipped. With max_density, when zoomed out so far that the images would cover
+    # the axes more than max_density times over, they are shown as points in the average color of the image instead
+    # (the default None never does that):
+    img_ax = ImageScatter(ax, max_density=1.0)
 
     # Other plotting can still be done with the original axes
     ax.plot(x, y, ls="--", label="line")
 
     # To make a legend the img_ax.legend() needs to be used to include the images.
     img_ax.legend()
+
+    # Which marker is under the mouse (display coordinates), or a function that is called when hovering/clicking:
+    hit = img_ax.query(event.x, event.y)   # {"label", "index", "x", "y", ...} or None
+    img_ax.connect_hover(lambda hit, event: print(hit))
     """
 
-    def __init__(self, ax):
+    def __init__(self, ax, max_density=None):
         self.ax = ax
         self.items = ([], [])
+        self.max_density = max_density
+        self.groups = []  # MarkerGroup of each scatter call
+        self.cids = []
+        self.canvas_cids = []
+        # KD-tree of all points in display coordinates, made again when the view changes (see query)
+        self.tree = None
+        self.tree_key = None
+        self.tree_groups = None   # The group of each point in the tree
+        self.tree_indices = None  # The index within its group of each point in the tree
+        self.tree_data = None     # The data coordinates of the points in the tree
 
     def scatter(self,
                 x: (list, tuple, int, float, np.ndarray),
@@ -93,6 +463,7 @@ class ImageScatter:
                 img_loc: str,
                 label: str = "",
                 zoom: float=0.05,
+                sprites: bool=False,
                 **kwargs):
         """
         Scatters the image located in img_loc to the indicated coordinates, x and y.
@@ -102,23 +473,130 @@ class ImageScatter:
         img_loc: location of the image to be scattered. Anything matplotlib.pyplot.imread can handle.
         label: optional label for a legend, string.
         zoom: float, scaling of the image, default 0.05.
+        sprites: bool, draw all points with one SpriteScatter instead of an AnnotationBbox each. Use this for many
+                 (thousands of) points.
         """
-        img = getImage(img_loc, zoom=zoom)
+        prepared = image_cache.prepare(img_loc)
+        boxes = None
+        # If adding an array of points with sprites, they are all drawn by one artist
+        if sprites:
+            img = SpriteScatter(prepared, np.column_stack([np.ravel(x), np.ravel(y)]), zoom=zoom)
+            self.ax.add_artist(img)
 
         # If adding only 1 point with floats (or ints)
-        if isinstance(x, (int, float)):
+        elif isinstance(x, (int, float)):
+            img = MipmapImage(prepared, zoom=zoom)
             img_box = AnnotationBbox(img, (x, y), frameon=False)
             self.ax.add_artist(img_box)
+            boxes = [img_box]
 
         # If adding an array of points. Note each point is added separately (So don't use too many points! :))
         else:
+            img = MipmapImage(prepared, zoom=zoom)
+            boxes = []
             for i in range(len(x)):
                 img_box = AnnotationBbox(img, (x[i], y[i]), frameon=False)
                 self.ax.add_artist(img_box)
+                boxes.append(img_box)
 
         self.items[0].append(img)
         self.items[1].append(label)
 
+        self.groups.append(MarkerGroup(self.ax, np.ravel(x), np.ravel(y), prepared, zoom, boxes=boxes,
+                                       sprites=img if sprites else None))
+        if not self.cids:
+            self.connect()
+        self.groups[-1].update_view(self.max_density)
+        self.tree = None
+
+    def update_view(self, ax=None):
+        """Shows the markers that are in view, called when the x or y limits change"""
+        for group in self.groups:
+            group.update_view(self.max_density)
+        self.tree = None
+
+    def view_key(self):
+        """Changes when the display position of the points changes"""
+        return tuple(self.ax.get_xlim()) + tuple(self.ax.get_ylim()) + tuple(self.ax.bbox.bounds)
+
+    def build_tree(self):
+        """The KD-tree of the points in display coordinates, only made again if the view changed"""
+        from scipy.spatial import cKDTree  # scipy is only needed for the hover and click queries
+        key = self.view_key()
+        if self.tree is None or key != self.tree_key:
+            xy = np.concatenate([np.column_stack([group.index.x, group.index.y]) for group in self.groups])
+            self.tree = cKDTree(self.ax.transData.transform(xy))
+            self.tree_data = xy
+            self.tree_groups = np.repeat(np.arange(len(self.groups)), [len(group.index) for group in self.groups])
+            self.tree_indices = np.concatenate([np.arange(len(group.index)) for group in self.groups])
+            self.tree_key = key
+        return self.tree
+
+    def query(self, x, y):
+        """
+        The marker under a position on the screen, the one on top if there are multiple.
+        :param x: x in display coordinates (pixels, like event.x of a mouse event)
+        :param y: y in display coordinates
+        :return: dictionary with the label, group (number of the scatter call), index (of the point in that call),
+                 x and y (data coordinates) and distance (pixels) of the point, None if there is no marker there
+        """
+        if not self.groups:
+            return None
+        tree = self.build_tree()
+        radii = np.array([group.radius() for group in self.groups])
+        candidates = np.array(tree.query_ball_point((x, y), radii.max()), dtype=int)
+        if len(candidates) == 0:
+            return None
+        groups = self.tree_groups[candidates]
+        distances = np.hypot(*(tree.data[candidates] - (x, y)).T)
+        # Only markers that are drawn: within their own size and inside the axes
+        hits = candidates[distances <= radii[groups]]
+        if len(hits) == 0:
+            return None
+        (x0, x1), (y0, y1) = sorted(self.ax.get_xlim()), sorted(self.ax.get_ylim())
+        data = self.tree_data[hits]
+        drawn = (data[:, 0] >= x0) & (data[:, 0] <= x1) & (data[:, 1] >= y0) & (data[:, 1] <= y1)
+        if not np.any(drawn):
+            return None
+        # The last one drawn is on top: the latest scatter call, and the last point in it
+        hits, data = hits[drawn], data[drawn]
+        top = np.lexsort((self.tree_indices[hits], self.tree_groups[hits]))[-1]
+        group = int(self.tree_groups[hits[top]])
+        return {"label": self.items[1][group], "group": group, "index": int(self.tree_indices[hits[top]]),
+                "x": float(data[top, 0]), "y": float(data[top, 1]),
+                "distance": float(np.hypot(*(tree.data[hits[top]] - (x, y))))}
+
+    def connect_hover(self, on_hover=None, on_click=None):
+        """
+        Calls on_hover(hit, event) when the mouse moves and on_click(hit, event) when it clicks in the axes, with hit
+        the result of query (None if there is no marker under the mouse).
+        """
+        canvas = self.ax.figure.canvas
+
+        def callback(function):
+            def on_event(event):
+                if event.inaxes is self.ax:
+                    function(self.query(event.x, event.y), event)
+            return on_event
+
+        if on_hover is not None:
+            self.canvas_cids.append(canvas.mpl_connect("motion_notify_event", callback(on_hover)))
+        if on_click is not None:
+            self.canvas_cids.append(canvas.mpl_connect("button_press_event", callback(on_click)))
+
+    def connect(self):
+        """Update the markers when the view limits change (zooming, panning)"""
+        self.cids = [self.ax.callbacks.connect("xlim_changed", self.update_view),
+                     self.ax.callbacks.connect("ylim_changed", self.update_view)]
+
+    def disconnect(self):
+        for cid in self.cids:
+            self.ax.callbacks.disconnect(cid)
+        self.cids = []
+        for cid in self.canvas_cids:
+            self.ax.figure.canvas.mpl_disconnect(cid)
+        self.canvas_cids = []
+
     def legend(self, img_only:bool=False, **kwargs):
         """
         Adds the legend, similar to normal legends, but a custom handler is required for the images.
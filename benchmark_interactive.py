@@ -0,0 +1,182 @@
+"""
+Times the slider and radio button updates of InteractivePlot (interactive_line_profiles.py) for synthetic grids like
+the one on the slider slide, for increasing grid sizes and for the different ways of storing and drawing the profiles
+(dense arrays, memory mapped, compact layout, float32, LineCollection, blitting). Nothing is shown on screen (Agg).
+
+Usage:
+python benchmark_interactive.py --values 3 5 --params 4 --lines 5 --wave 600 --output interactive_times.json
+"""
+import matplotlib
+matplotlib.use("Agg")  # No screen needed
+import matplotlib.pyplot as plt
+import numpy as np
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+from interactive_line_profiles import InteractivePlot, compact_profiles
+from profile_store import ProfileStore
+
+
+# The ways to store and draw the profiles: (profile layout, InteractivePlot options)
+LAYOUTS = {"dense": ("full", {}),
+           "compact": ("compact", {}),
+           "compact_float32": ("float32", {}),
+           "memmap": ("memmap", {}),
+           "line_collection": ("compact", {"line_collection": True}),
+           "line_collection_blit": ("compact", {"line_collection": True, "blit": True}),
+           "memmap_collection_blit": ("memmap", {"line_collection": True, "blit": True})}
+
+
+def synthetic_grid(n_values=5, n_params=4, n_lines=5, n_wave=600):
+    """
+    A grid like the one of the slider slide: line j is cos or sin of (parameter j) * t.
+    :return: line_profiles (N_models, N_lines, 2, N_wave), model_parameters, parameter_names, unique_params, line_names
+    """
+    unique_params = [np.arange(1, n_values + 1, dtype=float) for i in range(n_params)]
+    model_parameters = np.stack(np.meshgrid(*unique_params, indexing="ij"), axis=-1).reshape(-1, n_params)
+    t = np.linspace(0, np.pi * 2, n_wave)
+    line_profiles = np.empty((len(model_parameters), n_lines, 2, n_wave))
+    line_profiles[:, :, 0] = t
+    for j in range(n_lines):
+        function = np.cos if j % 2 == 0 else np.sin
+        line_profiles[:, j, 1] = function(model_parameters[:, j % n_params, None] * t)
+    parameter_names = [chr(ord("a") + i) for i in range(n_params)]
+    line_names = [f"line {j}" for j in range(n_lines)]
+    return line_profiles, model_parameters, parameter_names, unique_params, line_names
+
+
+def make_profiles(line_profiles, layout, directory):
+    """
+    The profiles in the requested layout.
+    :return: profiles, wavelengths (None for the full layout)
+    """
+    if layout == "full":
+        return line_profiles, None
+    wavelengths, flux = compact_profiles(line_profiles, np.float32 if layout == "float32" else None)
+    if layout == "memmap":
+        path = os.path.join(directory, "profiles.npy")
+        ProfileStore.from_array(path, flux, wavelengths=wavelengths)
+        store = ProfileStore(path)
+        return store, store.wavelengths
+    return flux, wavelengths
+
+
+def profile_memory(profiles):
+    """The memory used by the profiles (for a memory map only the cached models count)"""
+    if isinstance(profiles, ProfileStore):
+        return profiles.cached_nbytes
+    return profiles.nbytes
+
+
+def time_events(ip, events):
+    """
+    Runs events and times each of them (on Agg the drawing happens right away, so it is included).
+    :param events: list of (name, function)
+    :return: dictionary with the latencies (s) per event name
+    """
+    latencies = {}
+    for name, function in events:
+        t0 = time.perf_counter()
+        function()
+        # With blitting the update has drawn (and blitted) what changed already, a full draw would hide the difference
+        if ip.fig.stale and not ip.blit:
+            ip.fig.canvas.draw()
+        latencies.setdefault(name, []).append(time.perf_counter() - t0)
+    return latencies
+
+
+def slider_events(ip, n_events, axis):
+    """Moves a slider back and forth through its values"""
+    values = ip.unique_params[axis]
+    path = list(values[1:]) + list(values[-2::-1])
+    return [("slider", lambda value=path[k % len(path)]: ip.sliders[axis].set_val(value)) for k in range(n_events)]
+
+
+def benchmark_layout(grid, layout, options, n_events=20, trace_memory=False):
+    """
+    Times the single model and the "show all" (radio button) updates for one layout.
+    :return: dictionary with the results
+    """
+    line_profiles, model_parameters, parameter_names, unique_params, line_names = grid
+    with tempfile.TemporaryDirectory() as directory:
+        profiles, wavelengths = make_profiles(line_profiles, layout, directory)
+        fig = plt.figure(figsize=(16, 9))
+        t0 = time.perf_counter()
+        ip = InteractivePlot(fig, profiles, model_parameters, parameter_names, unique_params, line_names,
+                             wavelengths=wavelengths, **options)
+        ip.init_plot()
+        fig.canvas.draw()
+        build = time.perf_counter() - t0
+
+        if trace_memory:
+            tracemalloc.start()
+        # Show all models along the last parameter while moving the first one
+        events = slider_events(ip, n_events, 0)
+        events.append(("radio", lambda: ip.radio_buttons.set_active(len(parameter_names))))
+        events += [("slider_show_all", function) for name, function in slider_events(ip, n_events, 0)]
+        events.append(("radio", lambda: ip.radio_buttons.set_active(0)))
+        latencies = time_events(ip, events)
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+        if trace_memory:
+            tracemalloc.stop()
+
+        result = {"build": build, "profile_memory": profile_memory(profiles), "peak_python_memory": peak,
+                  "artists": len(fig.findobj())}
+        for name, values in latencies.items():
+            values = np.array(values) * 1e3
+            result[name] = {"n": len(values), "p50": float(np.percentile(values, 50)),
+                            "p95": float(np.percentile(values, 95)), "max": float(np.max(values))}
+        ip.disconnect()
+        plt.close(fig)
+    return result
+
+
+def run_benchmark(values=(5,), n_params=4, n_lines=5, n_wave=600, layouts=None, n_events=20, trace_memory=False):
+    """
+    Runs the benchmark for every grid size and layout.
+    :return: list of dictionaries with the results
+    """
+    layouts = list(LAYOUTS) if layouts is None else layouts
+    results = []
+    for n_values in values:
+        grid = synthetic_grid(n_values, n_params, n_lines, n_wave)
+        n_models = len(grid[1])
+        for name in layouts:
+            layout, options = LAYOUTS[name]
+            result = benchmark_layout(grid, layout, options, n_events, trace_memory)
+            result.update({"layout": name, "n_models": n_models, "n_values": n_values, "n_params": n_params,
+                           "n_lines": n_lines, "n_wave": n_wave})
+            results.append(result)
+            print(f"{n_models:>8} models {name:<24} build {result['build'] * 1e3:7.0f} ms, " +
+                  ", ".join(f"{event} p50 {result[event]['p50']:6.1f} p95 {result[event]['p95']:6.1f} ms"
+                            for event in ["slider", "slider_show_all", "radio"]) +
+                  f", profiles {result['profile_memory'] / 1e6:6.1f} MB")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description="Benchmark the updates of InteractivePlot.")
+    parser.add_argument("--values", type=int, nargs="*", default=[3, 5], help="Number of values per parameter")
+    parser.add_argument("--params", type=int, default=4, help="Number of parameters")
+    parser.add_argument("--lines", type=int, default=5, help="Number of lines (at most 5 subplots)")
+    parser.add_argument("--wave", type=int, default=600, help="Number of wavelength points per line")
+    parser.add_argument("--layouts", nargs="*", default=None, choices=list(LAYOUTS), help="Layouts to compare")
+    parser.add_argument("--events", type=int, default=20, help="Number of slider events per mode")
+    parser.add_argument("--tracemalloc", action="store_true", help="Measure the peak python memory (slower)")
+    parser.add_argument("--output", default=None, help="File to write the results to (json)")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.values, args.params, min(args.lines, 5), args.wave, args.layouts, args.events,
+                            args.tracemalloc)
+    if args.output is not None:
+        output = {"meta": {"matplotlib": matplotlib.__version__, "numpy": np.__version__,
+                           "python": platform.python_version(), "machine": platform.machine()},
+                  "results": results}
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=1)
+        print(f"Results written to {args.output}")
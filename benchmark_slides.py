@@ -0,0 +1,236 @@
+"""
+Times how long each slide of the_talk.py takes to build and to draw, without showing anything on screen.
+Every slide (and every step of a slide) is timed for the combinations of latex/serif/dark/xkcd styles.
+
+Usage:
+python benchmark_slides.py --output slide_times.json
+python benchmark_slides.py --output new_times.json --compare slide_times.json
+
+With --compare the results are checked against the earlier results, slowdowns are printed and the script exits with
+a non-zero exit code, so it can also be used in scripts.
+"""
+import matplotlib
+matplotlib.use("Agg")  # No screen needed, must happen before the talk imports pyplot
+import matplotlib.pyplot as plt
+import numpy as np
+import contextlib
+import itertools
+import json
+import platform
+import shutil
+import sys
+import time
+
+import the_talk
+from the_talk import ThePresentation
+
+
+# Number of times the space bar does something on a slide, these steps are timed separately.
+SLIDE_STEPS = {"basics_slide": 4,
+               "figsize_slide": 1,
+               "histogram_example_slide": 9}
+
+TIMINGS = ["build", "first_draw", "redraw"]
+
+
+class DrawTimer:
+    """
+    Keeps track of the time spent in canvas.draw, also when the drawing happens inside the slide functions.
+    """
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.draw_time = 0.
+
+    @contextlib.contextmanager
+    def timing(self):
+        """Replaces the draw function of the canvas with a timed version while in the context."""
+        original_draw = self.canvas.draw
+        self.draw_time = 0.
+
+        def timed_draw(*args, **kwargs):
+            t0 = time.perf_counter()
+            result = original_draw(*args, **kwargs)
+            self.draw_time += time.perf_counter() - t0
+            return result
+
+        self.canvas.draw = timed_draw
+        try:
+            yield self
+        finally:
+            del self.canvas.draw  # Removes the instance attribute, the normal method is used again
+
+
+def combo_name(latex, serif, dark, xkcd):
+    """A short readable name for a combination of styles"""
+    return f"latex={int(latex)},serif={int(serif)},dark={int(dark)},xkcd={int(xkcd)}"
+
+
+def set_style(pres, latex, serif, dark, xkcd):
+    """
+    Puts the presentation in the requested style, starting from the default style.
+    Note: a lot of slides switch latex and serif on or off by themselves.
+    """
+    matplotlib.style.use("default")
+    pres.xkcd = False
+    pres.dark_theme = False
+    if dark:
+        plt.style.use("dark_background")
+        pres.dark_theme = True
+    the_talk.set_base_style()
+    if xkcd:
+        pres.switch_xkcd()
+    pres.latex = not latex
+    pres.switch_latex()
+    pres.serif = not serif
+    pres.switch_serif()
+
+
+def time_call(function, draw_timer):
+    """
+    Times a function that might also draw the figure.
+    :return: time spent outside of drawing, time spent drawing
+    """
+    with draw_timer.timing():
+        t0 = time.perf_counter()
+        function()
+        total = time.perf_counter() - t0
+    return total - draw_timer.draw_time, draw_timer.draw_time
+
+
+def time_draw(canvas):
+    """Times a single full draw of the figure"""
+    t0 = time.perf_counter()
+    canvas.draw()
+    return time.perf_counter() - t0
+
+
+def benchmark_slide(pres, slide, draw_timer):
+    """
+    Builds one slide and all its steps and times them.
+    :return: list of dictionaries with the timings of the slide (step 0) and each step.
+    """
+    canvas = pres.fig.canvas
+    slide_function = pres.slide_dict[slide]
+    results = []
+
+    pres.leave_slide()
+    pres.fig.clf()
+    pres.current_slide = slide
+
+    # Building the slide can draw the figure itself (the title slide does), that part is counted as drawing.
+    build, drawn = time_call(slide_function, draw_timer)
+    first_draw = time_draw(canvas) + drawn
+    redraw = time_draw(canvas)
+    results.append({"step": 0, "build": build, "first_draw": first_draw, "redraw": redraw})
+
+    for step in range(1, SLIDE_STEPS.get(slide_function.__name__, 0) + 1):
+        # next_step draws the figure when it is done.
+        build, first_draw = time_call(pres.next_step, draw_timer)
+        redraw = time_draw(canvas)
+        results.append({"step": step, "build": build, "first_draw": first_draw, "redraw": redraw})
+
+    for result in results:
+        result["slide"] = slide
+        result["name"] = slide_function.__name__
+    return results
+
+
+def run_benchmark(slides=None, combos=None, repeat=3, allow_latex=False):
+    """
+    Runs the benchmark for the requested slides and style combinations.
+    :param slides: list of slide numbers, None for all slides
+    :param combos: list of (latex, serif, dark, xkcd) tuples, None for all combinations
+    :param repeat: number of times each slide is timed, the median is stored
+    :param allow_latex: If latex can be used, otherwise the latex combinations are skipped.
+    :return: list of dictionaries with the results
+    """
+    pres = ThePresentation(start_slide=0, allow_latex=allow_latex, show=False)
+    draw_timer = DrawTimer(pres.fig.canvas)
+
+    if slides is None:
+        slides = sorted(pres.slide_dict)
+    if combos is None:
+        combos = [combo for combo in itertools.product([False, True], repeat=4) if allow_latex or not combo[0]]
+
+    results = []
+    for combo in combos:
+        name = combo_name(*combo)
+        for slide in slides:
+            runs = []
+            for i in range(repeat):
+                set_style(pres, *combo)
+                runs.append(benchmark_slide(pres, slide, draw_timer))
+            # Median over the repeats for each step
+            for step_runs in zip(*runs):
+                result = dict(step_runs[0])
+                for timing in TIMINGS:
+                    result[timing] = float(np.median([run[timing] for run in step_runs]))
+                result["combo"] = name
+                results.append(result)
+                print(f"{name:<35} slide {slide:>2} step {result['step']:>2}: " +
+                      ", ".join(f"{timing} {result[timing] * 1e3:8.1f} ms" for timing in TIMINGS))
+
+    pres.leave_slide()
+    plt.close(pres.fig)
+    matplotlib.style.use("default")
+    return results
+
+
+def compare(results, baseline, threshold=1.2, min_difference=0.005):
+    """
+    Compares the results to the baseline results.
+    :param threshold: Relative slowdown that counts as a regression
+    :param min_difference: Minimum absolute slowdown in seconds, to ignore noise on very fast things
+    :return: list of (combo, slide, step, timing, old, new) of all regressions
+    """
+    old_results = {(r["combo"], r["slide"], r["step"]): r for r in baseline}
+    regressions = []
+    for result in results:
+        old = old_results.get((result["combo"], result["slide"], result["step"]))
+        if old is None:
+            continue
+        for timing in TIMINGS:
+            if result[timing] > old[timing] * threshold and result[timing] - old[timing] > min_difference:
+                regressions.append((result["combo"], result["slide"], result["step"], timing,
+                                    old[timing], result[timing]))
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark the building and drawing of the slides.")
+    parser.add_argument("--output", default="slide_times.json", help="File to write the results to (json)")
+    parser.add_argument("--compare", default=None, help="Earlier results file to compare to")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Relative slowdown that counts as regression")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of times each slide is timed")
+    parser.add_argument("--slides", type=int, nargs="*", default=None, help="Slide numbers to benchmark")
+    parser.add_argument("--latex", action="store_true", help="Also benchmark with latex (requires latex)")
+    args = parser.parse_args()
+
+    use_latex = args.latex and shutil.which("latex") is not None
+    if args.latex and not use_latex:
+        print("No latex installation found, skipping the latex combinations.")
+
+    results = run_benchmark(slides=args.slides, repeat=args.repeat, allow_latex=use_latex)
+
+    output = {"meta": {"matplotlib": matplotlib.__version__,
+                       "numpy": np.__version__,
+                       "python": platform.python_version(),
+                       "machine": platform.machine(),
+                       "backend": matplotlib.get_backend(),
+                       "repeat": args.repeat},
+              "results": results}
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=1)
+    print(f"Results written to {args.output}")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, threshold=args.threshold)
+        for combo, slide, step, timing, old, new in regressions:
+            print(f"SLOWER: {combo} slide {slide} step {step} {timing}: {old * 1e3:.1f} ms -> {new * 1e3:.1f} ms")
+        if regressions:
+            print(f"{len(regressions)} slowdowns found compared to {args.compare}")
+            sys.exit(1)
+        print(f"No slowdowns compared to {args.compare}")
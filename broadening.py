@@ -0,0 +1,169 @@
+"""
+Rotational (vsini) and instrumental (resolution) broadening of line profiles.
+The profiles are interpolated onto a grid that is uniform in log(wavelength), on which both broadening kernels have
+the same shape everywhere, and convolved with an FFT. Many lines/models are broadened at once and the kernels and
+interpolation weights are cached, so moving the vsini slider is fast.
+
+Usage:
+wave, flux = broaden_fwline(wave, flux, vsini=150, resolution=20000)
+or, for flux of many models at once (the last axis is the wavelength):
+broadener = Broadener()
+flux = broadener.broaden(wave, flux, vsini=150, resolution=20000)
+"""
+from collections import OrderedDict
+import threading
+import numpy as np
+from scipy.signal import fftconvolve
+
+
+C_KMS = 299792.458  # Speed of light in km/s
+
+
+def rotation_kernel(vsini, dlnw, epsilon=0.6):
+    """
+    The rotational broadening profile (Gray, The observation and analysis of stellar photospheres).
+    :param vsini: Projected rotational velocity in km/s
+    :param dlnw: Step of the log(wavelength) grid
+    :param epsilon: Linear limb darkening coefficient
+    :return: normalized kernel with an odd number of points
+    """
+    dv = C_KMS * dlnw
+    half = int(np.ceil(vsini / dv))
+    if vsini <= 0 or half < 1:
+        return np.ones(1)
+    x = np.arange(-half, half + 1) * dv / vsini
+    x2 = np.clip(1 - x ** 2, 0, None)
+    kernel = 2 * (1 - epsilon) * np.sqrt(x2) + 0.5 * np.pi * epsilon * x2
+    return kernel / kernel.sum()
+
+
+def gaussian_kernel(resolution, dlnw, n_sigma=4):
+    """
+    The instrumental profile, a gaussian with a FWHM of wavelength / resolution.
+    :param resolution: The resolving power, R = wavelength / delta wavelength
+    :param dlnw: Step of the log(wavelength) grid
+    :return: normalized kernel with an odd number of points
+    """
+    if resolution is None or resolution <= 0:
+        return np.ones(1)
+    sigma = 1 / (resolution * 2 * np.sqrt(2 * np.log(2)) * dlnw)  # In pixels of the log grid
+    half = int(np.ceil(n_sigma * sigma))
+    if half < 1:
+        return np.ones(1)
+    x = np.arange(-half, half + 1)
+    kernel = np.exp(-0.5 * (x / sigma) ** 2)
+    return kernel / kernel.sum()
+
+
+def interpolation_weights(x_from, x_to):
+    """
+    Indices and weights to linearly interpolate from x_from to x_to along the last axis of an array (np.interp, but
+    for many arrays at once).
+    """
+    index = np.clip(np.searchsorted(x_from, x_to) - 1, 0, len(x_from) - 2)
+    weight = np.clip((x_to - x_from[index]) / (x_from[index + 1] - x_from[index]), 0, 1)
+    return index, weight
+
+
+def interpolate(values, weights):
+    """Interpolates values along the last axis with the weights of interpolation_weights"""
+    index, weight = weights
+    return values[..., index] * (1 - weight) + values[..., index + 1] * weight
+
+
+class Broadener:
+    """
+    Broadens profiles on a shared wavelength grid. Remembers the log(wavelength) grids and the kernels of the last
+    used vsini/resolution combinations.
+    """
+    def __init__(self, max_kernels=128, vsini_step=0.1):
+        """
+        :param max_kernels: Maximum number of cached kernels
+        :param vsini_step: vsini is rounded to this (km/s), so a slider gives a limited number of kernels
+        """
+        self.max_kernels = max_kernels
+        self.vsini_step = vsini_step
+        self.kernels = OrderedDict()
+        self.grids = OrderedDict()
+        self.lock = threading.Lock()  # The caches can be used from multiple threads (see prefetch.py)
+
+    def __getstate__(self):
+        # For other processes (see grid_fitting.py), the lock cannot be sent along
+        state = dict(vars(self))
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        vars(self).update(state)
+        self.lock = threading.Lock()
+
+    def log_grid(self, wave):
+        """
+        The uniform log(wavelength) grid for these wavelengths, with the interpolation weights to it and back.
+        :return: dlnw, weights to the grid, weights back to wave
+        """
+        wave = np.asarray(wave, dtype=float)
+        key = (wave[0], wave[-1], len(wave), hash(wave.tobytes()))
+        with self.lock:
+            return self.cached_grid(key, wave)
+
+    def cached_grid(self, key, wave):
+        if key not in self.grids:
+            lnw = np.log(wave)
+            log_grid = np.linspace(lnw[0], lnw[-1], len(wave))
+            self.grids[key] = (log_grid[1] - log_grid[0], interpolation_weights(lnw, log_grid),
+                               interpolation_weights(log_grid, lnw))
+            while len(self.grids) > self.max_kernels:
+                self.grids.popitem(last=False)
+        self.grids.move_to_end(key)
+        return self.grids[key]
+
+    def kernel(self, vsini, resolution, dlnw):
+        """The combined rotation and instrumental kernel"""
+        vsini = round(vsini / self.vsini_step) * self.vsini_step
+        key = (vsini, resolution, dlnw)
+        with self.lock:
+            return self.cached_kernel(key, vsini, resolution, dlnw)
+
+    def cached_kernel(self, key, vsini, resolution, dlnw):
+        if key not in self.kernels:
+            self.kernels[key] = np.convolve(rotation_kernel(vsini, dlnw), gaussian_kernel(resolution, dlnw))
+            while len(self.kernels) > self.max_kernels:
+                self.kernels.popitem(last=False)
+        self.kernels.move_to_end(key)
+        return self.kernels[key]
+
+    def broaden(self, wave, flux, vsini, resolution=None):
+        """
+        Broadens the flux of any number of profiles with the same wavelengths.
+        :param wave: The wavelengths, increasing
+        :param flux: Array with the flux, the last axis is the wavelength: shape (..., len(wave))
+        :param vsini: Projected rotational velocity in km/s
+        :param resolution: The resolving power of the instrument, None to leave out the instrumental broadening
+        :return: broadened flux with the same shape as flux
+        """
+        flux = np.asarray(flux)
+        if len(wave) < 2:
+            return flux
+        dlnw, to_log, from_log = self.log_grid(wave)
+        kernel = self.kernel(vsini, resolution, dlnw)
+        if len(kernel) == 1:
+            return flux
+        log_flux = interpolate(flux, to_log)
+        # Extend the ends with the edge values, otherwise the convolution pulls the edges down to 0
+        half = len(kernel) // 2
+        padding = [(0, 0)] * (log_flux.ndim - 1) + [(half, half)]
+        padded = np.pad(log_flux, padding, mode="edge")
+        convolved = fftconvolve(padded, kernel.reshape((1,) * (log_flux.ndim - 1) + (-1,)), mode="same", axes=-1)
+        return interpolate(convolved[..., half:half + log_flux.shape[-1]], from_log).astype(flux.dtype, copy=False)
+
+
+default_broadener = Broadener()
+
+
+def broaden_fwline(wave, flux, vsini, resolution=None):
+    """
+    Broadens a line profile with rotation and the instrumental profile.
+    :return: wave, broadened flux
+    """
+    return wave, default_broadener.broaden(wave, flux, vsini, resolution)
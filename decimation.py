@@ -0,0 +1,115 @@
+"""
+Level of detail for long spectra. A curve with far more points than there are pixels on the screen is reduced to the
+minimum and maximum of every pixel column, so it looks the same (narrow absorption lines stay) but is much faster to
+draw. The reduction is redone for the visible range when zooming or panning.
+
+Usage:
+decimator = LineDecimator()
+decimator.set_line_data(line, wave, flux)       # instead of line.set_data(wave, flux)
+decimator.set_collection_data(collection, segments)
+decimator.connect(axes)                         # redo it when the x limits change
+"""
+import numpy as np
+
+
+def min_max_envelope(x, y, x_min, x_max, n_bins):
+    """
+    The indices of the points to keep to draw y(x) between x_min and x_max with n_bins pixel columns: the first, the
+    minimum, the maximum and the last point of each column, and the point just outside the range on both sides.
+    :param x: Increasing x values
+    :param y: The y values
+    :return: increasing array with the indices of the points to keep
+    """
+    start = max(np.searchsorted(x, x_min, side="left") - 1, 0)
+    end = min(np.searchsorted(x, x_max, side="right") + 1, len(x))
+    if end - start <= 4 * n_bins:
+        return np.arange(start, end)
+
+    visible_x = x[start:end]
+    visible_y = y[start:end]
+    bins = np.clip(((visible_x - x_min) / (x_max - x_min) * n_bins).astype(np.intp), -1, n_bins)
+    # x is increasing, so every pixel column is one block of points
+    starts = np.flatnonzero(np.diff(bins, prepend=bins[0] - 1))
+    counts = np.diff(np.append(starts, len(bins)))
+    block = np.repeat(np.arange(len(starts)), counts)
+
+    keep = [starts, starts + counts - 1]
+    for reduce in (np.minimum, np.maximum):
+        extreme = np.repeat(reduce.reduceat(visible_y, starts), counts)
+        at_extreme = np.flatnonzero(visible_y == extreme)
+        # The first point of each block that has the extreme value
+        keep.append(at_extreme[np.unique(block[at_extreme], return_index=True)[1]])
+    return start + np.unique(np.concatenate(keep))
+
+
+class LineDecimator:
+    """
+    Keeps the full data of lines and LineCollections and shows them reduced to the visible pixel columns.
+    """
+    def __init__(self, pixels_per_bin=1):
+        """
+        :param pixels_per_bin: Width of the columns in pixels
+        """
+        self.pixels_per_bin = pixels_per_bin
+        self.lines = {}        # line: (x, y)
+        self.collections = {}  # collection: list of (x, y)
+        self.cids = []         # (axes, callback id)
+
+    @staticmethod
+    def increasing(x):
+        return len(x) < 2 or bool(np.all(np.diff(x) >= 0))
+
+    def n_bins(self, ax):
+        return max(int(ax.bbox.width / self.pixels_per_bin), 1)
+
+    def reduce(self, ax, x, y):
+        """The x and y of one curve, reduced for the current x limits of ax"""
+        if not self.increasing(x):
+            return x, y  # Cannot be done in columns
+        x_min, x_max = sorted(ax.get_xlim())
+        keep = min_max_envelope(x, y, x_min, x_max, self.n_bins(ax))
+        return x[keep], y[keep]
+
+    def set_line_data(self, line, x, y):
+        """Like line.set_data, but only the visible part, reduced to pixel columns, ends up in the line"""
+        x = np.asarray(x)
+        y = np.asarray(y)
+        self.lines[line] = (x, y)
+        line.set_data(*self.reduce(line.axes, x, y))
+
+    def set_collection_data(self, collection, segments):
+        """Like collection.set_segments, but with every segment reduced"""
+        curves = [(np.asarray(segment)[:, 0], np.asarray(segment)[:, 1]) for segment in segments]
+        self.collections[collection] = curves
+        collection.set_segments([np.column_stack(self.reduce(collection.axes, x, y)) for x, y in curves])
+
+    def forget(self, artist):
+        """Stops following a line or collection"""
+        self.lines.pop(artist, None)
+        self.collections.pop(artist, None)
+
+    def refresh(self, axes=None):
+        """
+        Reduces all curves again, for example after a zoom.
+        :param axes: Only the curves on these axes, None for all
+        """
+        for line, (x, y) in self.lines.items():
+            if axes is None or line.axes in axes:
+                line.set_data(*self.reduce(line.axes, x, y))
+        for collection, curves in self.collections.items():
+            if axes is None or collection.axes in axes:
+                collection.set_segments([np.column_stack(self.reduce(collection.axes, x, y)) for x, y in curves])
+
+    def on_xlim_changed(self, ax):
+        # The axes that share x with ax get a callback of their own once their limits are set, so only ax is done here
+        self.refresh([ax])
+
+    def connect(self, axes):
+        """Redo the reduction when the x limits of any of the axes change"""
+        for ax in axes:
+            self.cids.append((ax, ax.callbacks.connect("xlim_changed", self.on_xlim_changed)))
+
+    def disconnect(self):
+        for ax, cid in self.cids:
+            ax.callbacks.disconnect(cid)
+        self.cids = []
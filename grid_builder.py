@@ -0,0 +1,137 @@
+"""
+Builds a grid of (synthetic) line profiles from parameter axes and functions that compute the profiles, without a
+python loop over the models. The functions get the parameters of a chunk of models as arrays that broadcast against
+the wavelengths, so a whole chunk is done in one numpy call, and the result is written straight into a preallocated
+array (or a memory map on disk). The grid is cached on disk under a hash of its definition, so the next time it is only
+opened again.
+
+The functions get t (the x values, for example the wavelengths) and the parameters by name, each with shape
+(N_chunk, 1), and return x and y of the profile, which have to broadcast to (N_chunk, len(t)). They should only
+depend on their arguments: their code (and the variables of enclosing functions) is part of the hash, the values of
+global variables are not.
+
+Usage:
+grid = GridBuilder({"a": a, "b": b}, t, [("cos(at)", lambda t, a, b: (t, np.cos(a * t))),
+                                         ("sin(bt)", lambda t, a, b: (t, np.sin(b * t)))]).build()
+plot = InteractivePlot(fig, grid.line_profiles, grid.model_parameters, grid.parameter_names, grid.unique_params,
+                       grid.line_names)
+"""
+import hashlib
+import os
+import numpy as np
+
+from grid_loader import ModelGrid
+from profile_store import ProfileStore
+
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".grid_cache")
+
+
+def code_signature(code):
+    """The bytecode, constants and names of a code object, and of the functions defined in it"""
+    parts = [code.co_code, repr(code.co_names)]
+    for const in code.co_consts:
+        if hasattr(const, "co_code"):
+            parts += code_signature(const)
+        else:
+            parts.append(repr(const))
+    return parts
+
+
+def function_signature(function):
+    """Something that changes when the code of a function changes, to put in the hash"""
+    parts = [function.__qualname__] + code_signature(function.__code__)
+    for cell in function.__closure__ or ():
+        value = cell.cell_contents
+        parts.append(value.tobytes() if isinstance(value, np.ndarray) else repr(value))
+    return parts
+
+
+class GridBuilder:
+    """
+    Evaluates profile functions over the Cartesian product of the parameter axes, in chunks.
+    """
+    def __init__(self, axes, t, lines, dtype=float, chunk_models=1024, cache_dir=DEFAULT_CACHE_DIR, memmap=True):
+        """
+        :param axes: Dictionary of parameter name: values, the grid is every combination of them
+        :param t: The x values the functions are evaluated at, shape (N_wave,)
+        :param lines: List of (line name, function), see the top of this file
+        :param dtype: The type of the profiles
+        :param chunk_models: Number of models that are computed at once
+        :param cache_dir: Directory to cache the grid in, None to not cache it
+        :param memmap: Give the profiles as a ProfileStore (memory mapped, only possible with a cache) instead of
+                       an array in memory
+        """
+        self.parameter_names = list(axes)
+        self.axes = [np.asarray(values, dtype=float) for values in axes.values()]
+        self.t = np.asarray(t)
+        self.line_names = [name for name, function in lines]
+        self.functions = [function for name, function in lines]
+        self.dtype = np.dtype(dtype)
+        self.chunk_models = chunk_models
+        self.cache_dir = cache_dir
+        self.memmap = memmap and cache_dir is not None
+
+        self.grid_shape = tuple(len(values) for values in self.axes)
+        self.n_models = int(np.prod(self.grid_shape))
+        self.shape = (self.n_models, len(self.functions), 2, len(self.t))
+
+    def key(self):
+        """Hash of everything that determines the grid"""
+        hasher = hashlib.sha1()
+        hasher.update(repr((CACHE_VERSION, self.parameter_names, self.line_names, self.dtype.str,
+                            self.shape)).encode())
+        for values in self.axes + [self.t]:
+            hasher.update(np.ascontiguousarray(values).tobytes())
+        for function in self.functions:
+            for part in function_signature(function):
+                hasher.update(part if isinstance(part, bytes) else part.encode())
+        return hasher.hexdigest()[:16]
+
+    @property
+    def path(self):
+        """The cache file of the profiles"""
+        return os.path.join(self.cache_dir, f"grid_{self.key()}.npy")
+
+    def model_parameters(self, start=0, stop=None):
+        """The parameters of models start to stop (in C order of the axes), shape (N, N_params)"""
+        rows = np.arange(start, self.n_models if stop is None else stop)
+        positions = np.unravel_index(rows, self.grid_shape)
+        return np.column_stack([values[position] for values, position in zip(self.axes, positions)])
+
+    def fill(self, out):
+        """Computes all profiles into out, an array (or memory map) with shape self.shape"""
+        for start in range(0, self.n_models, self.chunk_models):
+            stop = min(start + self.chunk_models, self.n_models)
+            parameters = self.model_parameters(start, stop)
+            kwargs = {name: parameters[:, i, None] for i, name in enumerate(self.parameter_names)}
+            for j, function in enumerate(self.functions):
+                x, y = function(self.t, **kwargs)
+                out[start:stop, j, 0] = x  # Broadcasts if x is the same for all models
+                out[start:stop, j, 1] = y
+        return out
+
+    def build(self):
+        """
+        The grid, from the cache if it was built before.
+        :return: ModelGrid (grid_loader.py) with the arguments for InteractivePlot
+        """
+        model_parameters = self.model_parameters()
+        if self.cache_dir is None:
+            line_profiles = self.fill(np.empty(self.shape, dtype=self.dtype))
+            return ModelGrid(line_profiles, model_parameters, self.parameter_names, self.line_names, None)
+
+        path = self.path
+        if not os.path.exists(path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Written next to the cache first, so an interrupted build does not leave a broken cache
+            new_path = path[:-len(".npy")] + ".new.npy"
+            store = ProfileStore.create(new_path, self.shape, dtype=self.dtype)
+            self.fill(store.data)
+            store.flush()
+            del store
+            os.replace(new_path, path)
+
+        line_profiles = ProfileStore(path) if self.memmap else np.load(path)
+        return ModelGrid(line_profiles, model_parameters, self.parameter_names, self.line_names, None)
@@ -0,0 +1,175 @@
+"""
+Fits a whole model grid to an observed spectrum. Every model's lines are interpolated onto the observed wavelengths
+that fall within the line and the chi-square is computed for all models, in chunks of models at a time. Grids in a
+ProfileStore (memory mapped) are split over multiple processes, which each read their own chunks from disk.
+
+Usage:
+fitter = GridFitter(line_profiles, obs_wave, obs_flux, obs_error)
+result = fitter.fit(grid_index, parameter_names, processes=4)
+result.print_report()
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+import numpy as np
+
+from broadening import Broadener, interpolation_weights, interpolate
+from profile_store import ProfileStore
+
+
+class FitResult:
+    """The chi-square of every model, with the best fit and the marginal likelihood of each parameter"""
+    def __init__(self, chi2, n_points, grid_index, parameter_names):
+        """
+        :param chi2: Chi-square of every model
+        :param n_points: Number of observed points that are used
+        :param grid_index: ParameterGridIndex of the grid
+        :param parameter_names: The names of the grid parameters
+        """
+        self.chi2 = chi2
+        self.n_points = n_points
+        self.grid_index = grid_index
+        self.parameter_names = list(parameter_names)
+        self.best_row = int(np.nanargmin(chi2))
+        self.best_chi2 = float(chi2[self.best_row])
+        self.best_parameters = {name: self.grid_index.values[axis][self.grid_index.positions[self.best_row, axis]]
+                                for axis, name in enumerate(self.parameter_names)}
+
+        # Likelihood of every model relative to the best one
+        self.likelihood = np.exp(-0.5 * np.nan_to_num(chi2 - self.best_chi2, nan=np.inf))
+
+    def marginal(self, axis):
+        """
+        The likelihood of each value of a parameter, summed over all other parameters.
+        :return: values, normalized likelihood
+        """
+        n_values = self.grid_index.shape[axis]
+        likelihood = np.bincount(self.grid_index.positions[:, axis], weights=self.likelihood, minlength=n_values)
+        return self.grid_index.values[axis], likelihood / likelihood.sum()
+
+    def marginals(self):
+        """Dictionary with the marginal likelihoods of all parameters"""
+        return {name: self.marginal(axis) for axis, name in enumerate(self.parameter_names)}
+
+    def print_report(self):
+        print(f"Best model: row {self.best_row}, chi2 = {self.best_chi2:.2f}, "
+              f"reduced chi2 = {self.best_chi2 / max(self.n_points - len(self.parameter_names), 1):.3f}")
+        for name, value in self.best_parameters.items():
+            print(f"  {name} = {value:g}")
+        print("Marginal likelihoods:")
+        for name, (values, likelihood) in self.marginals().items():
+            print(f"  {name}: " + ", ".join(f"{value:g}: {prob:.3f}" for value, prob in zip(values, likelihood)))
+
+
+class GridFitter:
+    """
+    Computes the chi-square of every model in a grid against an observed spectrum.
+    """
+    def __init__(self, line_profiles, obs_wave, obs_flux, obs_error=None, wavelengths=None, vsini=None,
+                 resolutions=None, chunk_models=4096):
+        """
+        :param line_profiles: Array or ProfileStore with the line profiles, shape: (N_models, N_lines, 2, N_wave) or
+                              (N_models, N_lines, N_wave) with wavelengths
+        :param obs_wave: Wavelengths of the observed spectrum
+        :param obs_flux: Flux of the observed spectrum
+        :param obs_error: Errors of the observed flux, None to weigh all points the same
+        :param wavelengths: One wavelength array per line for compact profiles
+        :param vsini: Broaden the models with this vsini (km/s) before fitting
+        :param resolutions: The resolving power of each line, to broaden the models with
+        :param chunk_models: Number of models that are compared at once
+        """
+        self.line_profiles = line_profiles
+        self.obs_wave = np.asarray(obs_wave, dtype=float)
+        self.obs_flux = np.asarray(obs_flux, dtype=float)
+        self.obs_error = np.ones_like(self.obs_flux) if obs_error is None else np.asarray(obs_error, dtype=float)
+        self.wavelengths = wavelengths
+        self.compact = wavelengths is not None
+        self.n_lines = line_profiles.shape[1]
+        self.vsini = vsini
+        self.resolutions = [None] * self.n_lines if resolutions is None else list(resolutions)
+        self.broaden = vsini is not None or any(resolution is not None for resolution in self.resolutions)
+        self.broadener = Broadener()
+        self.chunk_models = chunk_models
+
+        # For compact profiles the observed points of each line and the interpolation weights are the same for
+        # every model
+        self.line_points = None
+        if self.compact:
+            self.line_points = [self.points_in(wave) for wave in wavelengths]
+
+    def points_in(self, wave):
+        """The observed points within the wavelengths of a line, with the weights to interpolate the line onto them"""
+        selection = np.flatnonzero((self.obs_wave >= wave[0]) & (self.obs_wave <= wave[-1]))
+        return selection, interpolation_weights(wave, self.obs_wave[selection])
+
+    @property
+    def n_points(self):
+        """The number of observed points that are compared with the models"""
+        if self.compact:
+            return sum(len(selection) for selection, weights in self.line_points)
+        first = np.asarray(self.line_profiles[0])
+        return sum(len(self.points_in(first[i, 0])[0]) for i in range(self.n_lines))
+
+    def line_chi2(self, wave, flux, selection, weights, resolution):
+        """Chi-square of one line of multiple models with the same wavelengths"""
+        if self.broaden:
+            flux = self.broadener.broaden(wave, flux, self.vsini or 0, resolution)
+        residuals = (interpolate(flux, weights) - self.obs_flux[selection]) / self.obs_error[selection]
+        return np.sum(residuals ** 2, axis=-1)
+
+    def chunk_chi2(self, profiles):
+        """
+        The chi-square of a chunk of models.
+        :param profiles: The line profiles of the models
+        :return: array with the chi-square of each model
+        """
+        chi2 = np.zeros(len(profiles))
+        for i in range(self.n_lines):
+            if self.compact:
+                selection, weights = self.line_points[i]
+                chi2 += self.line_chi2(self.wavelengths[i], profiles[:, i], selection, weights, self.resolutions[i])
+                continue
+            waves = profiles[:, i, 0]
+            if np.all(waves == waves[0]):
+                selection, weights = self.points_in(waves[0])
+                chi2 += self.line_chi2(waves[0], profiles[:, i, 1], selection, weights, self.resolutions[i])
+            else:
+                for j, model_lines in enumerate(profiles):
+                    selection, weights = self.points_in(model_lines[i, 0])
+                    chi2[j] += self.line_chi2(model_lines[i, 0], model_lines[i, 1], selection, weights,
+                                              self.resolutions[i])
+        return chi2
+
+    def range_chi2(self, start, end):
+        """The chi-square of the models from start to end, read in chunks"""
+        chi2 = np.empty(end - start)
+        for chunk_start in range(start, end, self.chunk_models):
+            chunk_end = min(chunk_start + self.chunk_models, end)
+            profiles = self.line_profiles[chunk_start:chunk_end]
+            chi2[chunk_start - start:chunk_end - start] = self.chunk_chi2(np.asarray(profiles, dtype=float))
+        return chi2
+
+    def chi2(self, processes=None):
+        """
+        The chi-square of all models.
+        :param processes: Number of processes, only used for a ProfileStore. None for the number of cpus.
+        :return: array with the chi-square of every model
+        """
+        n_models = len(self.line_profiles)
+        if processes is None:
+            processes = os.cpu_count() or 1
+        if not isinstance(self.line_profiles, ProfileStore) or processes <= 1 or n_models <= self.chunk_models:
+            # Arrays in memory would have to be copied to every process, that is slower than doing it here
+            return self.range_chi2(0, n_models)
+        edges = np.linspace(0, n_models, min(processes * 4, -(-n_models // self.chunk_models)) + 1).astype(int)
+        with ProcessPoolExecutor(processes) as executor:
+            parts = executor.map(self.range_chi2, edges[:-1], edges[1:])
+            return np.concatenate(list(parts))
+
+    def fit(self, grid_index, parameter_names, processes=None):
+        """
+        Fits the grid.
+        :param grid_index: ParameterGridIndex of the grid
+        :param parameter_names: The names of the grid parameters
+        :return: FitResult
+        """
+        return FitResult(self.chi2(processes), self.n_points, grid_index, parameter_names)
@@ -0,0 +1,127 @@
+"""
+Index for a grid of models, to find the model belonging to a set of parameter values without going through all models.
+"""
+import numpy as np
+
+
+class ParameterGridIndex:
+    """
+    Maps parameter values to the rows of model_parameters.
+    For (nearly) rectangular grids an N-dimensional array with the row of every grid point is used. For sparse grids
+    a dictionary is used instead. For the "show all models along one parameter" queries the rows along each parameter
+    are sorted beforehand, so every query takes the same time, independent of the size of the grid.
+
+    Usage:
+    index = ParameterGridIndex(model_parameters, unique_params)
+    row = index.row([1, 2, 3])                 # None if the model is not in the grid
+    rows = index.axis_rows(0, [1, 2, 3])       # All models with the last two parameters 2 and 3, sorted by the first
+    """
+    def __init__(self, model_parameters, unique_params, max_fill=4):
+        """
+        :param model_parameters:    Array with all model parameters, shape: (N_models, N_parameters)
+        :param unique_params:       The unique values of each of the parameters
+        :param max_fill:            The dense array is used if it is at most max_fill times larger than the number of
+                                    models.
+        """
+        model_parameters = np.asarray(model_parameters)
+        self.n_models, self.n_params = model_parameters.shape
+        self.values = [np.sort(np.asarray(values, dtype=float)) for values in unique_params]
+        self.shape = tuple(len(values) for values in self.values)
+        self.value_dicts = [{value: i for i, value in enumerate(values.tolist())} for values in self.values]
+
+        # The position of each model along each parameter axis
+        self.positions = np.empty(model_parameters.shape, dtype=np.intp)
+        for i, values in enumerate(self.values):
+            positions = np.clip(np.searchsorted(values, model_parameters[:, i]), 0, len(values) - 1)
+            if not np.allclose(values[positions], model_parameters[:, i]):
+                raise ValueError(f"Parameter {i} has values that are not in unique_params")
+            self.positions[:, i] = positions
+
+        rows = np.arange(self.n_models)
+        self.dense = np.prod(self.shape, dtype=float) <= max_fill * self.n_models
+        if self.dense:
+            # -1 marks grid points without a model
+            self.lookup = np.full(self.shape, -1, dtype=np.intp)
+            self.lookup[tuple(self.positions.T)] = rows
+        else:
+            keys = np.ravel_multi_index(tuple(self.positions.T), self.shape)
+            self.lookup = dict(zip(keys.tolist(), rows.tolist()))
+
+            # For each axis the rows are sorted by the other parameters first, and then by the parameter of the axis.
+            # The models with the same other parameters are then next to each other: one "slice".
+            self.axis_slices = []
+            for axis in range(self.n_params):
+                other_shape = self.shape[:axis] + self.shape[axis + 1:]
+                other_keys = np.ravel_multi_index(tuple(np.delete(self.positions, axis, axis=1).T), other_shape)
+                order = np.lexsort((self.positions[:, axis], other_keys))
+                sorted_keys = other_keys[order]
+                starts = np.concatenate(([0], np.flatnonzero(np.diff(sorted_keys)) + 1))
+                ends = np.append(starts[1:], len(order))
+                slices = {key: (start, end) for key, start, end in zip(sorted_keys[starts].tolist(),
+                                                                        starts.tolist(), ends.tolist())}
+                self.axis_slices.append((order, other_shape, slices))
+
+    def position(self, axis, value):
+        """
+        The position of a value on the axis of a parameter.
+        :return: integer, or None if the value is not in the grid
+        """
+        position = self.value_dicts[axis].get(float(value))
+        if position is None:
+            # Not exactly the same value, check if it is close
+            values = self.values[axis]
+            nearest = int(np.argmin(np.abs(values - value)))
+            if np.isclose(values[nearest], value):
+                position = nearest
+        return position
+
+    def positions_of(self, values):
+        """
+        :param values: A value for each parameter
+        :return: list with the positions of the values, or None if any of them is not in the grid
+        """
+        positions = [self.position(axis, value) for axis, value in enumerate(values)]
+        if any(position is None for position in positions):
+            return None
+        return positions
+
+    def row(self, values):
+        """
+        The row of the model with these parameter values.
+        :param values: A value for each parameter
+        :return: integer, or None if there is no such model
+        """
+        positions = self.positions_of(values)
+        if positions is None:
+            return None
+        if self.dense:
+            row = int(self.lookup[tuple(positions)])
+            return row if row >= 0 else None
+        return self.lookup.get(int(np.ravel_multi_index(positions, self.shape)))
+
+    def axis_rows(self, axis, values):
+        """
+        The rows of all models that have the same parameters as values, except for the parameter of axis.
+        :param axis: The index of the parameter that is free
+        :param values: A value for each parameter, the value for the free parameter is ignored
+        :return: Array with the rows, sorted by the value of the free parameter
+        """
+        values = list(values)
+        values[axis] = self.values[axis][0]
+        positions = self.positions_of(values)
+        if positions is None:
+            return np.array([], dtype=np.intp)
+        if self.dense:
+            positions[axis] = slice(None)
+            rows = self.lookup[tuple(positions)]
+            return rows[rows >= 0]
+        order, other_shape, slices = self.axis_slices[axis]
+        key = int(np.ravel_multi_index(positions[:axis] + positions[axis + 1:], other_shape))
+        if key not in slices:
+            return np.array([], dtype=np.intp)
+        start, end = slices[key]
+        return order[start:end]
+
+    def axis_values(self, axis, rows):
+        """The values of the parameter of axis for the given rows"""
+        return self.values[axis][self.positions[rows, axis]]
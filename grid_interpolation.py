@@ -0,0 +1,84 @@
+"""
+Multilinear interpolation between the models of a rectangular grid, to show profiles for parameter values in between
+the grid points. Only the 2^d models around the requested values are read, so this also works with a memory mapped
+ProfileStore.
+
+Usage:
+interpolator = GridInterpolator(ParameterGridIndex(model_parameters, unique_params), line_profiles)
+profiles = interpolator([[1.5, 2.25, 3.0]])  # shape: (1,) + line_profiles.shape[1:]
+"""
+import itertools
+import numpy as np
+
+
+class GridInterpolator:
+    """
+    Blends the 2^d models around a point in parameter space, weighted by how close the point is to each of them.
+    """
+    def __init__(self, grid_index, line_profiles):
+        """
+        :param grid_index: ParameterGridIndex of the grid, must be (nearly) rectangular so it has the dense lookup
+        :param line_profiles: Array or ProfileStore with the profiles, indexed by model row
+        """
+        if not grid_index.dense:
+            raise ValueError("Interpolation needs a (nearly) rectangular grid")
+        self.grid_index = grid_index
+        self.line_profiles = line_profiles
+        self.n_params = grid_index.n_params
+        # The offsets of the corners of a grid cell, shape: (2^d, d)
+        self.corners = np.array(list(itertools.product([0, 1], repeat=self.n_params)), dtype=np.intp)
+
+    def neighbours(self, points):
+        """
+        The models around each point and their weights.
+        :param points: Array with parameter values, shape: (N_points, N_parameters)
+        :return: rows, weights, both with shape (N_points, 2^d). Models that are not in the grid have row -1 and
+                 weight 0, the weights of the other models are scaled up to add up to 1.
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        lower = np.empty(points.shape, dtype=np.intp)
+        fraction = np.zeros(points.shape)
+        for axis, values in enumerate(self.grid_index.values):
+            if len(values) == 1:
+                lower[:, axis] = 0
+                continue
+            index = np.clip(np.searchsorted(values, points[:, axis], side="right") - 1, 0, len(values) - 2)
+            lower[:, axis] = index
+            fraction[:, axis] = np.clip((points[:, axis] - values[index]) / (values[index + 1] - values[index]), 0, 1)
+
+        # Corner indices for every point, shape: (N_points, 2^d, d)
+        indices = np.minimum(lower[:, None, :] + self.corners[None, :, :],
+                             np.array(self.grid_index.shape) - 1)
+        rows = self.grid_index.lookup[tuple(np.moveaxis(indices, -1, 0))]
+        weights = np.prod(np.where(self.corners[None, :, :] == 1, fraction[:, None, :], 1 - fraction[:, None, :]),
+                          axis=-1)
+
+        # Missing models do not count
+        weights[rows < 0] = 0
+        total = weights.sum(axis=1, keepdims=True)
+        weights = np.divide(weights, total, out=np.zeros_like(weights), where=total > 0)
+        rows[weights == 0] = -1
+        return rows, weights
+
+    def __call__(self, points):
+        """
+        The interpolated profiles.
+        :param points: Array with parameter values, shape: (N_points, N_parameters)
+        :return: array with shape: (N_points,) + line_profiles.shape[1:], nan for points without any models around
+        """
+        rows, weights = self.neighbours(points)
+        needed = np.unique(rows[rows >= 0])
+        if len(needed) == 0:
+            shape = (len(rows),) + tuple(self.line_profiles.shape[1:])
+            return np.full(shape, np.nan)
+        models = self.line_profiles[needed]
+        dtype = np.result_type(models.dtype, np.float32)
+        result = np.zeros((len(rows),) + models.shape[1:], dtype=dtype)
+        positions = np.searchsorted(needed, rows)
+        broadcast = (slice(None),) + (None,) * (models.ndim - 1)
+        for corner in range(rows.shape[1]):
+            use = rows[:, corner] >= 0
+            if np.any(use):
+                result[use] += weights[use, corner][broadcast] * models[positions[use, corner]]
+        result[weights.sum(axis=1) == 0] = np.nan
+        return result
@@ -0,0 +1,200 @@
+"""
+Loads a directory with model output files into everything InteractivePlot needs (line_profiles, model_parameters,
+parameter_names, unique_params and line_names). The files are parsed in parallel and the result is saved in a cache
+next to them: a memory mapped ProfileStore, the parameters and a manifest with the modification time and size of every
+file. Next time only the files that changed are parsed again, if nothing changed the grid is opened straight from the
+cache. Each update of the cache writes new, numbered data files and only then replaces the manifest that names them, so
+an interrupted update leaves the previous cache as it was.
+
+The parsing depends on the models, so you give a parser: a function that gets the path of one file and returns
+(parameters, lines), with parameters a dictionary of parameter name: value and lines a dictionary of
+line name: (wave, flux). Every model must have the same lines with the same number of points. The parser is sent to
+other processes, so it must be a function defined at the top level of a module.
+
+Usage:
+grid = GridLoader("path/to/models", my_parser, pattern="*.dat").load()
+plot = InteractivePlot(fig, grid.line_profiles, grid.model_parameters, grid.parameter_names, grid.unique_params,
+                       grid.line_names)
+"""
+from concurrent.futures import ProcessPoolExecutor
+import fnmatch
+import json
+import os
+import numpy as np
+
+from profile_store import ProfileStore
+
+
+CACHE_VERSION = 2
+
+
+class ModelGrid:
+    """The loaded grid, with the arguments for InteractivePlot"""
+    def __init__(self, line_profiles, model_parameters, parameter_names, line_names, files):
+        self.line_profiles = line_profiles
+        self.model_parameters = model_parameters
+        self.parameter_names = parameter_names
+        self.line_names = line_names
+        self.files = files  # The file of each model
+        self.unique_params = [np.unique(model_parameters[:, i]) for i in range(len(parameter_names))]
+
+
+def parse_to_arrays(parser, path, parameter_names=None, line_names=None):
+    """
+    Parses a file and puts the result in a fixed order.
+    :return: parameter names, line names, parameter values, profiles with shape (N_lines, 2, N_wave)
+    """
+    parameters, lines = parser(path)
+    parameter_names = list(parameters) if parameter_names is None else parameter_names
+    line_names = list(lines) if line_names is None else line_names
+    values = np.array([parameters[name] for name in parameter_names], dtype=float)
+    profiles = np.array([[np.asarray(lines[name][0]), np.asarray(lines[name][1])] for name in line_names],
+                        dtype=float)
+    return parameter_names, line_names, values, profiles
+
+
+class GridLoader:
+    """
+    Parses a directory of model files, with a cache that is kept up to date.
+    """
+    def __init__(self, directory, parser, pattern="*", cache_dir=None, processes=None, verbose=True):
+        """
+        :param directory: The directory with the model files
+        :param parser: Function that parses one file, see the top of this file
+        :param pattern: Only files matching this pattern are models (for example "*.dat")
+        :param cache_dir: Where the cache is saved, by default .grid_cache in the directory
+        :param processes: Number of processes to parse with, None for the number of cpus
+        """
+        self.directory = directory
+        self.parser = parser
+        self.pattern = pattern
+        self.cache_dir = os.path.join(directory, ".grid_cache") if cache_dir is None else cache_dir
+        self.processes = processes
+        self.verbose = verbose
+
+        self.manifest_path = os.path.join(self.cache_dir, "manifest.json")
+
+    def data_paths(self, generation):
+        """The profiles and parameters files of one version of the cache"""
+        return (os.path.join(self.cache_dir, f"profiles_{generation}.npy"),
+                os.path.join(self.cache_dir, f"parameters_{generation}.npy"))
+
+    def scan(self):
+        """
+        :return: dictionary with the model files (relative to the directory) and their (modification time, size)
+        """
+        files = {}
+        for root, dirs, names in os.walk(self.directory):
+            dirs[:] = [name for name in dirs if os.path.join(root, name) != self.cache_dir and
+                       not name.startswith(".")]
+            for name in names:
+                if fnmatch.fnmatch(name, self.pattern):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    files[os.path.relpath(path, self.directory)] = [stat.st_mtime_ns, stat.st_size]
+        return dict(sorted(files.items()))
+
+    def read_manifest(self):
+        """The manifest of the cache, None if there is no (usable) cache"""
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("version") != CACHE_VERSION:
+            return None
+        if not all(os.path.exists(path) for path in self.data_paths(manifest["generation"])):
+            return None
+        return manifest
+
+    def open_cache(self, manifest):
+        """Opens the grid from the cache"""
+        profiles_path, parameters_path = self.data_paths(manifest["generation"])
+        return ModelGrid(ProfileStore(profiles_path), np.load(parameters_path),
+                         manifest["parameter_names"], manifest["line_names"], list(manifest["files"]))
+
+    def remove_old_data(self, generation):
+        """Removes the data files of other versions of the cache (older ones, or those of an interrupted update)"""
+        keep = {os.path.basename(path) for path in self.data_paths(generation)}
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(("profiles_", "parameters_")) and name.endswith(".npy") and name not in keep:
+                os.remove(os.path.join(self.cache_dir, name))
+
+    def parse(self, paths, parameter_names, line_names):
+        """Parses files in parallel, gives (values, profiles) for each file, in order"""
+        full_paths = [os.path.join(self.directory, path) for path in paths]
+        n = len(full_paths)
+        names = ([parameter_names] * n, [line_names] * n)
+        if self.processes == 1 or n < 2:
+            results = map(parse_to_arrays, [self.parser] * n, full_paths, *names)
+            yield from (result[2:] for result in results)
+            return
+        with ProcessPoolExecutor(self.processes) as executor:
+            chunksize = max(1, n // (4 * (self.processes or os.cpu_count() or 1)))
+            for result in executor.map(parse_to_arrays, [self.parser] * n, full_paths, *names, chunksize=chunksize):
+                yield result[2:]
+
+    def load(self):
+        """
+        Loads the grid, parsing only the files that are new or changed since the cache was made.
+        :return: ModelGrid
+        """
+        files = self.scan()
+        if not files:
+            raise FileNotFoundError(f"No files matching {self.pattern} in {self.directory}")
+        manifest = self.read_manifest()
+        if manifest is not None and manifest["files"] == files:
+            return self.open_cache(manifest)
+
+        old_files = {} if manifest is None else manifest["files"]
+        old_rows = {} if manifest is None else {path: row for row, path in enumerate(manifest["files"])}
+        changed = [path for path, signature in files.items() if old_files.get(path) != signature]
+        kept = [path for path in files if path not in changed]
+        if self.verbose:
+            print(f"Parsing {len(changed)} of {len(files)} model files")
+
+        if manifest is None:
+            # Parse one file to find out the names and shapes
+            parameter_names, line_names, values, profiles = parse_to_arrays(
+                self.parser, os.path.join(self.directory, changed[0]))
+        else:
+            parameter_names, line_names = manifest["parameter_names"], manifest["line_names"]
+            old_profiles_path, old_parameters_path = self.data_paths(manifest["generation"])
+            profiles = np.load(old_profiles_path, mmap_mode="r")[0]
+        rows = {path: row for row, path in enumerate(files)}
+
+        # The new cache is written next to the old one under the next number, the manifest switches to it at the end
+        os.makedirs(self.cache_dir, exist_ok=True)
+        generation = 0 if manifest is None else manifest["generation"] + 1
+        profiles_path, parameters_path = self.data_paths(generation)
+        store = ProfileStore.create(profiles_path, (len(files),) + profiles.shape)
+        parameters = np.empty((len(files), len(parameter_names)))
+
+        if kept:
+            old_store = np.load(old_profiles_path, mmap_mode="r")
+            old_parameters = np.load(old_parameters_path)
+            for start in range(0, len(kept), 1024):
+                paths = kept[start:start + 1024]
+                old = [old_rows[path] for path in paths]
+                new = [rows[path] for path in paths]
+                store.data[new] = old_store[old]
+                parameters[new] = old_parameters[old]
+            del old_store
+
+        for path, (values, profiles) in zip(changed, self.parse(changed, parameter_names, line_names)):
+            if profiles.shape != store.shape[1:]:
+                raise ValueError(f"{path} has profiles with shape {profiles.shape}, expected {store.shape[1:]}")
+            store.data[rows[path]] = profiles
+            parameters[rows[path]] = values
+        store.flush()
+        del store
+
+        np.save(parameters_path, parameters)
+
+        # Replacing the manifest is the only step that changes the cache, until then the old one is still complete
+        manifest = {"version": CACHE_VERSION, "generation": generation, "parameter_names": parameter_names,
+                    "line_names": line_names, "files": files}
+        with open(self.manifest_path + ".new", "w") as f:
+            json.dump(manifest, f)
+        os.replace(self.manifest_path + ".new", self.manifest_path)
+        self.remove_old_data(generation)
+        return self.open_cache(manifest)
@@ -2,13 +2,36 @@
 Plotting routine for interactive investigation of model grids showing spectroscopic line profiles.
 By: Frank Backs
 """
+import time
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
+from matplotlib.backend_bases import TimerBase
+from matplotlib.collections import LineCollection
 from matplotlib.widgets import Slider, RadioButtons
 
+from broadening import Broadener
+from decimation import LineDecimator
+from grid_fitting import GridFitter
+from grid_index import ParameterGridIndex
+from grid_interpolation import GridInterpolator
+from prefetch import NeighbourPrefetcher
 
 
+def compact_profiles(line_profiles, dtype=None):
+    """
+    Splits line profiles with the same wavelengths for every model into one wavelength array per line and the flux.
+    :param line_profiles: Array with shape: (N_models, N_lines, 2, N_wavelength_points)
+    :param dtype: Data type of the flux, for example np.float32 to save more memory
+    :return: list of wavelength arrays (one per line), flux array with shape: (N_models, N_lines, N_wavelength_points)
+    """
+    line_profiles = np.asarray(line_profiles)
+    wavelengths = line_profiles[0, :, 0]
+    if not np.all(line_profiles[:, :, 0] == wavelengths):
+        raise ValueError("Not all models have the same wavelengths, the compact profiles cannot be used")
+    flux = np.ascontiguousarray(line_profiles[:, :, 1], dtype=dtype)
+    return list(wavelengths.copy()), flux
+
 
 class InteractivePlot:
     """
@@ -22,10 +45,14 @@ class InteractivePlot:
     "extra_wave" and "extra_flux" and optionally "extra_error".
     """
     def __init__(self, fig, line_profiles, model_parameters,
-                 parameter_names, unique_params, line_names, use_wave_range=False, ncols=5):
+                 parameter_names, unique_params, line_names, use_wave_range=False, ncols=5, wavelengths=None,
+                 coalesce_updates=False, blit=False, line_collection=False, line_dict=None, resolution=None,
+                 add_vsini=False, interpolate=False, decimate=False, prefetch=False):
         """
         :param line_profiles:       Array with all lines profiles for each set of parameters and each line
                                     Shape: (N_models, N_lines, 2, N_wavelength_points)
+                                    Can also be a ProfileStore (profile_store.py) for grids that do not fit in memory.
+                                    With wavelengths only the flux is given, shape: (N_models, N_lines, N_wave)
         :param model_parameters:    Array with all model parameters, shape: (N_models, N_parameters)
         :param parameter_names:     List with the names of the varied parameters
         :param unique_params:       The unique values of each of the parameters
@@ -34,18 +61,57 @@ class InteractivePlot:
         :param line_dict:           A dictionary with line names matched to (resolution at the line, minwave, maxwave)
         :param use_wave_range:      Determines if the minwave and maxwave of line_dict are going to be used
                                     to determine the displayed range. Otherwise it will be determined using
+        :param wavelengths:         One wavelength array per line, for when all models have the same wavelengths.
+                                    line_profiles then only contains the flux (see compact_profiles).
+        :param coalesce_updates:    Collect the slider changes and update the plot at most once per frame
+        :param blit:                Only redraw the lines and sliders when a slider moves, instead of the whole figure
+        :param line_collection:     Draw all models of a subplot as one LineCollection instead of separate lines
+        :param resolution:          Resolving power to broaden all lines with, if there is no line_dict
+        :param add_vsini:           Adds a vsini slider, the lines are broadened with the selected vsini
+        :param interpolate:         Let the sliders move freely and interpolate between the models of the grid
+        :param decimate:            Reduce long profiles to the min/max of every pixel column of the visible range
+        :param prefetch:            Load (and broaden) the models next to the current one in the background
         """
 
         self.line_profiles = line_profiles
         self.model_parameters = model_parameters
-        self.parameter_names = list(parameter_names) #+ [r"$v \sin i$"]
+        self.parameter_names = list(parameter_names) + ([r"$v \sin i$"] if add_vsini else [])
         self.unique_params = unique_params
         self.line_names = line_names
         self.use_wave_range = use_wave_range
+        self.line_dict = line_dict
         self.param_dict = dict(zip(parameter_names, unique_params))
+        self.compact = wavelengths is not None
+        self.wavelengths = None if wavelengths is None else [np.asarray(wave) for wave in wavelengths]
+
+        # Broadening of the lines, the resolution of each line comes from line_dict if it is given
+        self.broadener = Broadener()
+        if line_dict is not None:
+            self.resolutions = [line_dict[name][0] for name in line_names]
+        else:
+            self.resolutions = [resolution] * len(line_names)
+
+        # Index to look up the models belonging to the slider values. vsini is not part of the grid.
+        self.grid_params = [i for i, name in enumerate(self.parameter_names) if "sin i" not in name]
+        self.grid_names = [self.parameter_names[i] for i in self.grid_params]
+        self.grid_index = ParameterGridIndex(np.asarray(model_parameters)[:, self.grid_params],
+                                             [unique_params[i] for i in self.grid_params])
+        self.interpolate = interpolate
+        self.interpolator = GridInterpolator(self.grid_index, line_profiles) if interpolate else None
+
+        # Loads the next models while you look at the current ones
+        self.prefetcher = None
+        if prefetch:
+            self.prefetcher = NeighbourPrefetcher(self.grid_index, line_profiles, preprocess=self.preprocess_model)
+
+        # Level of detail for profiles with many more points than pixels
+        self.decimator = LineDecimator() if decimate else None
 
         # The lines as matplotlib defines them
         self.mpl_lines = []
+        # Or one LineCollection per subplot
+        self.line_collection = line_collection
+        self.collections = []
 
         # Slider options
         self.length = 0.3
@@ -79,6 +145,26 @@ class InteractivePlot:
         # Initialize radio buttons
         self.radio_buttons = None
 
+        # The extra spectrum (wave, flux, error) given to init_plot, the models can be fitted to it
+        self.extra_spectrum = (None, None, None)
+
+        # Options to keep dragging a slider smooth
+        self.coalesce_updates = coalesce_updates
+        self.frame_interval = 16  # ms, about 60 frames per second
+        self.update_timer = None
+        self.update_pending = False
+        self.blit = blit
+        self.background = None
+        self.draw_cid = None
+
+        # The update pipeline, see update
+        self.last_state = {"radio": "None"}  # The colorbar starts with None
+        self.selection = None
+        self.prefetch_position = None  # The slider values and radio axis of the last selected models
+        self.raw_profiles = None
+        self.shown_profiles = None
+        self.stage_times = {}
+
     def init_sliders(self):
         """
         Makes the sliders
@@ -100,14 +186,17 @@ class InteractivePlot:
 
             # Create the sliders, exception for vsini
             if "sin i" in param_name:
-                self.sliders.append(Slider(ax, param_name, 1, 300, valfmt="%i", fontsize=self.fontsize))
+                self.sliders.append(Slider(ax, param_name, 1, 300, valfmt="%i"))
             else:
                 self.sliders.append(Slider(ax, param_name, self.unique_params[i][0],
-                                           self.unique_params[i][-1], valstep=self.unique_params[i]))
+                                           self.unique_params[i][-1],
+                                           valstep=None if self.interpolate else self.unique_params[i]))
             self.sliders[-1].label.set_size(self.fontsize)
         # Tell the sliders to call the function self.update when a value changes
         for slider in self.sliders:
-            slider.on_changed(self.update)
+            slider.on_changed(self.request_update)
+            # With blitting the plot redraws the sliders itself
+            slider.drawon = not self.blit
 
     def init_radio(self):
         """
@@ -122,7 +211,7 @@ class InteractivePlot:
                                  0.125))
         # Add a button that says None to only show the specified parameters
         # Assume last parameter is vsini which is calculated on the fly, so leave that out
-        button_names = ["None"] + self.parameter_names
+        button_names = ["None"] + self.grid_names
         self.radio_buttons = RadioButtons(rax, button_names)#, fontsize=self.fontsize)
         for label in self.radio_buttons.labels:
             label.set_size(self.fontsize)
@@ -134,6 +223,7 @@ class InteractivePlot:
         :return:
         """
         # self.fig, self.axarr = plt.subplots(self.nrows, self.ncols, figsize=self.figsize)
+        self.extra_spectrum = (extra_wave, extra_flux, extra_error)
         gs = self.fig.add_gridspec(4, 2)
         self.axarr = []
         for i in range(4):
@@ -145,7 +235,7 @@ class InteractivePlot:
         self.axarr.append(plt.subplot(gs[:,1], aspect=1))
         # self.axarr = plt.add_subplot
 
-        cmap = matplotlib.cm.get_cmap("viridis")
+        cmap = plt.get_cmap("viridis")
         colors = [cmap(val) for val in np.linspace(0, 1, self.max_models)]
 
         for i in range(len(self.line_names)):
@@ -166,13 +256,7 @@ class InteractivePlot:
                 continue
             else:
                 ax.set_title(self.line_names[i], fontsize=self.fontsize)
-                # Create a list in which the lines are stored, these will be updated, rather than new lines plotted
-                self.mpl_lines.append([])
-                line, = ax.plot(self.line_profiles[0][i][0], self.line_profiles[0][i][1], c=colors[0])
-                self.mpl_lines[-1].append(line)
-                for j in range(1, self.max_models):
-                    line, = ax.plot([], [], c=colors[j])
-                    self.mpl_lines[-1].append(line)
+                self.init_lines(ax, i, colors)
                 # ax.axhline(1, ls="--", c="0.5", alpha=0.5, zorder=-1)
 
                 # specify the x limits if desired, otherwise it will be based on what
@@ -202,18 +286,278 @@ class InteractivePlot:
         self.init_sliders()
         self.init_radio()
 
+        if self.decimator is not None:
+            # Also reduce the first model, which is plotted with the full profiles
+            for lines in self.mpl_lines:
+                for line in lines:
+                    if len(line.get_xdata()) > 0:
+                        self.decimator.set_line_data(line, *line.get_data())
+            for collection in self.collections:
+                self.decimator.set_collection_data(collection, collection.get_segments())
+            self.decimator.connect(self.axarr)
+
+        if self.blit and self.fig.canvas.supports_blit:
+            # The lines are only drawn by the plot itself, on top of the background saved after each full draw
+            for lines in self.panel_artists():
+                for line in lines:
+                    line.set_animated(True)
+            # The sliders too: their value text is outside of their axes, so a new value would be drawn on top of the
+            # old one in the background
+            for ax in self.sliderAxes:
+                ax.set_animated(True)
+            self.draw_cid = self.fig.canvas.mpl_connect("draw_event", self.on_draw)
+        else:
+            self.blit = False
+
         # gs.tight_layout(rect=[0.05, 0.20, 0.95, 0.90])
 
         # plt.show()
         # plt.draw()
 
+    def init_lines(self, ax, i, colors):
+        """
+        Makes the matplotlib lines (or the LineCollection) of line i in the subplot ax.
+        """
+        if self.line_collection:
+            # Model j along a parameter gets color j, like the separate lines
+            collection = LineCollection(self.segments(self.line_profiles[[0]], i), cmap=plt.get_cmap("viridis"),
+                                        norm=matplotlib.colors.Normalize(0, self.max_models - 1))
+            collection.set_array(np.zeros(1))
+            ax.add_collection(collection)
+            ax.autoscale_view()
+            self.collections.append(collection)
+            return
+
+        # Create a list in which the lines are stored, these will be updated, rather than new lines plotted
+        self.mpl_lines.append([])
+        if self.compact:
+            # The wavelengths never change, the unused lines are hidden
+            for j in range(self.max_models):
+                line, = ax.plot(self.wavelengths[i], self.line_profiles[0][i], c=colors[j], visible=j == 0)
+                self.mpl_lines[-1].append(line)
+        else:
+            line, = ax.plot(self.line_profiles[0][i][0], self.line_profiles[0][i][1], c=colors[0])
+            self.mpl_lines[-1].append(line)
+            for j in range(1, self.max_models):
+                line, = ax.plot([], [], c=colors[j])
+                self.mpl_lines[-1].append(line)
+
+    def segments(self, profiles, i):
+        """
+        The profiles of line i of multiple models in the shape a LineCollection wants.
+        :param profiles: The line profiles of the models (line_profiles[rows])
+        :return: array with shape: (N_models, N_wavelength_points, 2)
+        """
+        if self.compact:
+            flux = profiles[:, i]
+            segments = np.empty(flux.shape + (2,), dtype=flux.dtype)
+            segments[:, :, 0] = self.wavelengths[i]
+            segments[:, :, 1] = flux
+            return segments
+        return np.swapaxes(profiles[:, i], 1, 2)
+
+    def update_collections(self, profiles):
+        """Shows the profiles of the selected models with the LineCollections, None if there are no models"""
+        if profiles is None:
+            for collection in self.collections:
+                collection.set_segments([])
+                collection.set_array(np.zeros(0))
+            return
+        for i, collection in enumerate(self.collections):
+            if self.decimator is not None:
+                self.decimator.set_collection_data(collection, self.segments(profiles, i))
+            else:
+                collection.set_segments(self.segments(profiles, i))
+            collection.set_array(np.arange(len(profiles)))
+
+    def interpolated_profiles(self, values):
+        """
+        Interpolates the profiles at the slider values. With a radio button selected, the profiles at every grid
+        value of that parameter are given instead.
+        :param values: The slider values of the grid parameters
+        :return: array with the profiles, only for the points that have models around them
+        """
+        if self.radio_buttons.value_selected in self.grid_names:
+            param_index = self.grid_names.index(self.radio_buttons.value_selected)
+            grid_values = self.grid_index.values[param_index]
+            points = np.repeat([values], len(grid_values), axis=0).astype(float)
+            points[:, param_index] = grid_values
+        else:
+            points = [values]
+        profiles = self.interpolator(points)
+        found = ~np.all(np.isnan(profiles.reshape(len(profiles), -1)), axis=1)
+        return profiles[found]
+
+    def preprocess_model(self, model_lines, vsini):
+        """Broadens the profiles of one model, for the prefetcher"""
+        return self.broaden_profiles(model_lines[None], vsini)[0]
+
+    def broaden_profiles(self, profiles, vsini):
+        """
+        Broadens the profiles of the selected models with vsini and the resolution of each line.
+        :param profiles: The line profiles of the models (line_profiles[rows])
+        :param vsini: In km/s, None if there is no vsini slider
+        :return: broadened copy of the profiles (or the profiles themselves if there is nothing to do)
+        """
+        if vsini is None and all(resolution is None for resolution in self.resolutions):
+            return profiles
+        vsini = 0 if vsini is None else vsini
+        profiles = np.array(profiles)
+        for i, resolution in enumerate(self.resolutions):
+            if self.compact:
+                profiles[:, i] = self.broadener.broaden(self.wavelengths[i], profiles[:, i], vsini, resolution)
+                continue
+            waves = profiles[:, i, 0]
+            if np.all(waves == waves[0]):
+                # All models at once
+                profiles[:, i, 1] = self.broadener.broaden(waves[0], profiles[:, i, 1], vsini, resolution)
+            else:
+                for model_lines in profiles:
+                    model_lines[i, 1] = self.broadener.broaden(model_lines[i, 0], model_lines[i, 1], vsini, resolution)
+        return profiles
+
+    def panel_artists(self):
+        """The artists with the models for each subplot"""
+        if self.line_collection:
+            return [[collection] for collection in self.collections]
+        return self.mpl_lines
+
     def add_line(self, line, wave, flux):#, line_name, vsini):
         """
         Updates the the x and y data of the specified matplotlib line object
         """
-        # res, min_wave, max_wave = self.line_dict[line_name]
-        # wave, flux = broaden_fwline(wave, flux, vsini, res)
-        line.set_data(wave, flux)
+        if self.decimator is not None:
+            self.decimator.set_line_data(line, wave, flux)
+        else:
+            line.set_data(wave, flux)
+
+    def show_profile(self, line, profile, i):
+        """
+        Shows the profile of line i of a model with a matplotlib line object. For the compact profiles only the flux
+        is changed (unless the profiles are decimated).
+        """
+        if self.compact:
+            if self.decimator is not None:
+                self.add_line(line, self.wavelengths[i], profile)
+            else:
+                line.set_ydata(profile)
+            line.set_visible(True)
+        else:
+            wave, flux = profile
+            self.add_line(line, wave, flux)
+
+    def hide_line(self, line):
+        """Removes the profile from a matplotlib line object"""
+        # Also in compact mode, otherwise a zoom would still reduce (and draw) the profile of the hidden line
+        if self.decimator is not None:
+            self.decimator.forget(line)
+        if self.compact:
+            line.set_visible(False)
+        else:
+            line.set_data([], [])
+
+    def request_update(self, val=None):
+        """
+        Called when a slider moves. With coalesce_updates the update happens at the next frame, all slider changes
+        before that are handled by that single update.
+        """
+        if not self.coalesce_updates:
+            self.update(val)
+            return
+        if self.update_timer is None:
+            self.update_timer = self.fig.canvas.new_timer(interval=self.frame_interval)
+            self.update_timer.single_shot = True
+            self.update_timer.add_callback(self.flush_updates)
+        if type(self.update_timer) is TimerBase:
+            # A canvas without an event loop (for example Agg) has timers that never fire
+            self.update(val)
+        elif not self.update_pending:
+            self.update_pending = True
+            self.update_timer.start()
+
+    def flush_updates(self):
+        """Does the update that is waiting for the next frame, if there is one"""
+        if self.update_pending:
+            self.update_pending = False
+            self.update(None)
+
+    def on_draw(self, event):
+        """After the figure is drawn, save it without the lines and sliders and draw those on top"""
+        # Saving to a vector format also draws, but there is nothing to save for blitting then
+        if getattr(event.canvas, "supports_blit", False):
+            self.background = event.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_animated(event.renderer)
+
+    def draw_animated(self, renderer=None):
+        """Draws the lines and the sliders, unless the plot is hidden"""
+        if renderer is None:
+            renderer = self.fig.canvas.get_renderer()
+        for ax, lines in zip(self.axarr, self.panel_artists()):
+            if ax.get_visible():
+                for line in lines:
+                    line.draw(renderer)
+        for ax in self.sliderAxes:
+            ax.draw(renderer)  # Does nothing if the axes are hidden
+
+    def redraw(self):
+        """
+        Shows the changes. With blitting only the lines and the sliders are drawn on the saved background, otherwise
+        the whole figure is redrawn.
+        """
+        if not self.blit or self.background is None:
+            self.fig.canvas.draw_idle()
+            return
+        self.fig.canvas.restore_region(self.background)
+        self.draw_animated()
+        self.fig.canvas.blit(self.fig.bbox)
+
+    def disconnect(self):
+        """Disconnects the widgets and the draw event and stops a waiting update"""
+        self.radio_buttons.disconnect_events()
+        for slider in self.sliders:
+            slider.disconnect_events()
+        if self.decimator is not None:
+            self.decimator.disconnect()
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown()
+        if self.draw_cid is not None:
+            self.fig.canvas.mpl_disconnect(self.draw_cid)
+            self.draw_cid = None
+        if self.update_timer is not None:
+            self.update_timer.stop()
+            self.update_pending = False
+        self.background = None
+
+    def fit_to_extra(self, processes=None, jump=True):
+        """
+        Fits all models of the grid to the extra spectrum and moves the sliders to the best model.
+        :param processes: Number of processes to use for a ProfileStore, None for the number of cpus
+        :param jump: Move the sliders to the best model
+        :return: FitResult (see grid_fitting.py)
+        """
+        extra_wave, extra_flux, extra_error = self.extra_spectrum
+        if extra_wave is None or extra_flux is None:
+            raise ValueError("There is no extra spectrum to fit, give extra_wave and extra_flux to init_plot")
+        vsini = None
+        for i, param_name in enumerate(self.parameter_names):
+            if "sin i" in param_name:
+                vsini = self.sliders[i].val
+        fitter = GridFitter(self.line_profiles, extra_wave, extra_flux, extra_error, wavelengths=self.wavelengths,
+                            vsini=vsini, resolutions=self.resolutions)
+        result = fitter.fit(self.grid_index, self.grid_names, processes)
+        result.print_report()
+        if jump:
+            self.jump_to_model(result.best_row)
+        return result
+
+    def jump_to_model(self, row):
+        """Moves the sliders to the parameters of a model, and updates the plot once"""
+        for i in self.grid_params:
+            slider = self.sliders[i]
+            slider.eventson = False
+            slider.set_val(self.model_parameters[row, i])
+            slider.eventson = True
+        self.request_update()
 
     def update_colorbar(self):
         """
@@ -230,66 +574,140 @@ class InteractivePlot:
         self.cb.update_normal(self.colormap)
         self.cb.set_label(self.radio_buttons.value_selected)
 
-    def update(self, val):
+    def input_state(self):
+        """Everything the plot depends on: the slider values, the radio selection, vsini and the x limits"""
+        vsini = None
+        for i, param_name in enumerate(self.parameter_names):
+            if "sin i" in param_name:
+                vsini = self.sliders[i].val
+        return {"values": tuple(self.sliders[i].val for i in self.grid_params),
+                "radio": self.radio_buttons.value_selected,
+                "vsini": vsini,
+                "xlim": tuple(tuple(ax.get_xlim()) for ax in self.axarr)}
+
+    def timed(self, stage, function, *args):
+        """Runs a stage of the update and remembers how long it took"""
+        t0 = time.perf_counter()
+        result = function(*args)
+        self.stage_times[stage] = time.perf_counter() - t0
+        return result
+
+    def select_models(self, values, radio):
         """
-        Update the figure after the parameter selection has changed
+        Finds the models to show (or the points to interpolate at).
+        :return: True if the selection is different from before
         """
-        # make an array of booleans and mark every matching models as True, assume everything matches at first
-        selection = np.ones(self.model_parameters.shape[0], dtype=bool)
-        for i, param_name in enumerate(self.parameter_names):
-            if "sin i" not in param_name and param_name != self.radio_buttons.value_selected:
-                selection *= self.sliders[i].val == self.model_parameters[:, i]
+        if self.interpolate:
+            values = list(values)
+            if radio in self.grid_names:
+                values[self.grid_names.index(radio)] = None  # All values of this parameter are shown anyway
+            selection = ("points", tuple(values), radio)
+        else:
+            # Look up the matching models in the grid index, sorted by the selected parameter
+            param_index = None
+            if radio in self.grid_names:
+                param_index = self.grid_names.index(radio)
+                rows = self.grid_index.axis_rows(param_index, values)
             else:
-                vsini = self.sliders[i].val
+                row = self.grid_index.row(values)
+                rows = [] if row is None else [row]
+            selection = ("rows", tuple(int(row) for row in rows))
+            # For the prefetcher, once the selected models are fetched
+            self.prefetch_position = (values, param_index)
+        changed = selection != self.selection
+        self.selection = selection
+        return changed
+
+    def fetch_profiles(self, vsini):
+        """Gets the profiles of the selected models (already broadened if they come from the prefetcher)"""
+        kind, selected = self.selection[:2]
+        if kind == "points":
+            profiles = self.interpolated_profiles([self.sliders[i].val for i in self.grid_params])
+        elif len(selected) == 0:
+            profiles = None
+        elif self.prefetcher is not None:
+            profiles = self.prefetcher.get_many(selected, key=vsini)
+        else:
+            profiles = self.line_profiles[np.asarray(selected)]
+        self.raw_profiles = None if profiles is None or len(profiles) == 0 else profiles
+        if kind == "rows" and self.prefetcher is not None:
+            # Only after get_many, so the neighbours are loaded with the current vsini and do not hold up the
+            # models that are shown
+            self.prefetcher.moved(*self.prefetch_position)
+
+    def broaden_selected(self, vsini):
+        """Broadens the profiles of the selected models with vsini and the resolution"""
+        if self.raw_profiles is None or (self.prefetcher is not None and not self.interpolate):
+            self.shown_profiles = self.raw_profiles
+        else:
+            self.shown_profiles = self.broaden_profiles(self.raw_profiles, vsini)
 
-        # Check the number of matching models
-        selected_models = int(np.sum(selection))
+    def show_profiles(self):
+        """Puts the profiles of the selected models in the lines"""
+        profiles = self.shown_profiles
+        selected_models = 0 if profiles is None else len(profiles)
+
+        if self.line_collection:
+            self.update_collections(profiles)
 
         # If 1 model matches
-        if selected_models == 1:
-            model_lines = self.line_profiles[selection][0]
+        elif selected_models == 1:
+            model_lines = profiles[0]
 
             for i, lines in enumerate(self.mpl_lines):
-
-                wave, flux = model_lines[i]
-                # if wave[-1] - wave[0] < 0.01:
-                #     print("THIS LINE IS WEIRD! %s" % self.line_names[i])
-                #     lines[0].set_data([], [])
-                # else:
-                self.add_line(lines[0], wave, flux)
+                self.show_profile(lines[0], model_lines[i], i)
 
         # If multiple models are selected with a radio button
         elif selected_models > 1:
 
-            param_index = self.parameter_names.index(self.radio_buttons.value_selected)
-            sel_order = np.argsort(self.model_parameters[selection, param_index])
-
-            for i, model_lines in enumerate(self.line_profiles[selection][sel_order]):
+            for i, model_lines in enumerate(profiles):
                 for j, lines in enumerate(self.mpl_lines):
-
-                    wave, flux = model_lines[j]
-                    # if wave[-1] - wave[0] < 0.01:
-                    #     print("THIS LINE IS WEIRD! %s" % self.line_names[i])
-                    #     lines[i].set_data([], [])
-                    # else:
-                    self.add_line(lines[i], wave, flux)
+                    self.show_profile(lines[i], model_lines[j], j)
 
         # remove unused lines, if no models match all lines are removed
         for lines in self.mpl_lines:
             for j in range(selected_models, self.active_lines):
-                lines[j].set_data([], [])
+                self.hide_line(lines[j])
 
         # set the number of active lines to the current number
         self.active_lines = selected_models
 
+    def update(self, val):
+        """
+        Update the figure after the parameter selection has changed. Only the stages that depend on what changed are
+        done: select -> fetch -> broaden -> lines, colorbar (only for the radio buttons) and draw. The time of each
+        stage that ran is in self.stage_times.
+        """
+        state = self.input_state()
+        changed = {name for name, value in state.items() if name not in self.last_state or
+                   self.last_state[name] != value}
+        self.last_state = state
+        self.stage_times = {}
+        if not changed:
+            return
+
+        selection_changed = False
+        if "values" in changed or "radio" in changed:
+            selection_changed = self.timed("select", self.select_models, list(state["values"]), state["radio"])
+
+        # The prefetcher broadens while loading, so a new vsini means loading again
+        prefetched = self.prefetcher is not None and not self.interpolate
+        fetch = selection_changed or (prefetched and "vsini" in changed)
+        if fetch:
+            self.timed("fetch", self.fetch_profiles, state["vsini"])
+        if fetch or "vsini" in changed:
+            self.timed("broaden", self.broaden_selected, state["vsini"])
+            self.timed("lines", self.show_profiles)
+
         # Update the y axis range for each of the plots
         # for ax in np.ravel(self.axarr):
         #     ax.relim()
         #     ax.autoscale(axis="y")
 
-        self.update_colorbar()
-        self.fig.canvas.draw_idle()
-
-
-
-
+        if "radio" in changed:
+            # The colorbar changes, so everything is drawn again
+            self.timed("colorbar", self.update_colorbar)
+            self.timed("draw", self.fig.canvas.draw_idle)
+        else:
+            # The sliders moved, and maybe the lines changed
+            self.timed("draw", self.redraw)
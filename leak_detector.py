@@ -0,0 +1,165 @@
+"""
+Instrumentation to find things that stay alive after leaving a slide. On every slide transition it counts the artists
+on the figure, all artists that are still alive (also the ones no longer on the figure), the callbacks connected to
+the canvas, the memory allocated by python and the size of the stored slide info.
+If these numbers keep growing when going through the slides again, something is leaking.
+
+Usage:
+python leak_detector.py --loops 3
+
+Or on a running presentation:
+pres = ThePresentation(show=False)
+detector = LeakDetector(pres)
+... go through the slides ...
+detector.print_report()
+"""
+import gc
+import time
+import tracemalloc
+import numpy as np
+from matplotlib.artist import Artist
+from matplotlib.axes import Axes
+
+from slide_pool import nbytes
+
+
+METRICS = ["figure_artists", "figure_children", "axes", "live_artists", "detached_artists", "live_axes",
+           "canvas_callbacks", "axes_callbacks", "python_memory", "slide_info_bytes"]
+
+
+class LeakDetector:
+    """
+    Snapshots the state of the presentation on every slide transition, by wrapping ThePresentation.go_to_slide.
+    """
+    def __init__(self, pres, trace_memory=True):
+        """
+        :param pres: A ThePresentation
+        :param trace_memory: Use tracemalloc to follow the memory used by python (makes everything slower)
+        """
+        self.pres = pres
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        # List of dictionaries with from, to, the snapshots before and after and the difference
+        self.transitions = []
+        self.start = self.snapshot()
+
+        self.original_go_to_slide = pres.go_to_slide
+        pres.go_to_slide = self.go_to_slide
+
+    def stop(self):
+        """Stops the instrumentation"""
+        self.pres.go_to_slide = self.original_go_to_slide
+        if self.trace_memory:
+            tracemalloc.stop()
+
+    def snapshot(self):
+        """
+        Takes stock of everything that could leak.
+        :return: dictionary with the METRICS
+        """
+        gc.collect()
+        fig = self.pres.fig
+        live = [obj for obj in gc.get_objects() if isinstance(obj, Artist)]
+        figure_artists = fig.findobj()
+        return {"figure_artists": len(figure_artists),
+                "figure_children": len(fig.get_children()),
+                "axes": len(fig.axes),
+                "live_artists": len(live),
+                # Artists that are alive, but no longer part of any figure
+                "detached_artists": sum(1 for artist in live if artist.figure is None),
+                "live_axes": sum(1 for artist in live if isinstance(artist, Axes)),
+                "canvas_callbacks": sum(len(cbs) for cbs in fig.canvas.callbacks.callbacks.values()),
+                "axes_callbacks": sum(len(cbs) for ax in fig.axes for cbs in ax.callbacks.callbacks.values()),
+                "python_memory": tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0,
+                "slide_info_bytes": nbytes(self.pres.slide_info)}
+
+    def go_to_slide(self, slide):
+        """Takes a snapshot before and after the slide transition"""
+        from_slide = self.pres.current_slide
+        before = self.snapshot()
+        t0 = time.perf_counter()
+        self.original_go_to_slide(slide)
+        duration = time.perf_counter() - t0
+        after = self.snapshot()
+        self.transitions.append({"from": from_slide, "to": slide, "before": before, "after": after,
+                                 "delta": {key: after[key] - before[key] for key in METRICS},
+                                 "time": duration})
+
+    def per_slide(self):
+        """
+        Summarizes the transitions per slide. For every slide: the number of visits, the state after the first and
+        the last visit and the growth in between. If a slide does not leak, visiting it again should end up in the
+        same state (apart from random content).
+        :return: dictionary with slide number: summary
+        """
+        summary = {}
+        for transition in self.transitions:
+            slide = transition["to"]
+            if slide not in summary:
+                summary[slide] = {"visits": 0, "first": transition["after"], "deltas": []}
+            summary[slide]["visits"] += 1
+            summary[slide]["last"] = transition["after"]
+            summary[slide]["deltas"].append(transition["delta"])
+        for slide, info in summary.items():
+            info["growth"] = {key: info["last"][key] - info["first"][key] for key in METRICS}
+            info["mean_delta"] = {key: float(np.mean([delta[key] for delta in info["deltas"]])) for key in METRICS}
+        return summary
+
+    def report(self):
+        """
+        :return: dictionary with the per slide summaries and the total growth since the start
+        """
+        end = self.transitions[-1]["after"] if self.transitions else self.start
+        return {"per_slide": {slide: {"visits": info["visits"], "growth": info["growth"],
+                                      "mean_delta": info["mean_delta"]}
+                              for slide, info in sorted(self.per_slide().items())},
+                "total_growth": {key: end[key] - self.start[key] for key in METRICS},
+                "transitions": self.transitions}
+
+    def print_report(self):
+        """Prints the growth between the first and last visit of each slide"""
+        names = {number: function.__name__ for number, function in self.pres.slide_dict.items()}
+        short = ["artists", "children", "axes", "live", "detached", "live axes", "canvas cb", "axes cb",
+                 "memory kB", "info kB"]
+        print("Growth between the first and last visit of each slide:")
+        print(f"{'slide':<28} {'visits':>6}" + "".join(f"{name:>10}" for name in short))
+        for slide, info in sorted(self.per_slide().items()):
+            growth = dict(info["growth"])
+            growth["python_memory"] /= 1e3
+            growth["slide_info_bytes"] /= 1e3
+            print(f"{slide:>2} {names[slide]:<25} {info['visits']:>6}" +
+                  "".join(f"{growth[key]:>10.0f}" for key in METRICS))
+        total = self.report()["total_growth"]
+        print("Total growth since the start: " + ", ".join(f"{key} {value:.0f}" for key, value in total.items()))
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import matplotlib
+    matplotlib.use("Agg")  # No screen needed, must happen before the talk imports pyplot
+    import matplotlib.pyplot as plt
+    from the_talk import ThePresentation
+
+    parser = argparse.ArgumentParser(description="Go through the slides a few times and look for leaks.")
+    parser.add_argument("--loops", type=int, default=3, help="Number of times to go through all slides")
+    parser.add_argument("--output", default=None, help="File to write the full report to (json)")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="Do not trace python memory (faster)")
+    args = parser.parse_args()
+
+    pres = ThePresentation(start_slide=0, allow_latex=False, show=False)
+    detector = LeakDetector(pres, trace_memory=not args.no_tracemalloc)
+    for loop in range(args.loops):
+        for slide in list(pres.slide_dict)[1:] + [0]:
+            pres.go_to_slide(slide)
+            pres.fig.canvas.draw()
+    detector.print_report()
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(detector.report(), f, indent=1)
+        print(f"Full report written to {args.output}")
+    detector.stop()
+    plt.close(pres.fig)
@@ -0,0 +1,175 @@
+"""
+Loads the models next to the current slider position in the background, so the next slider step does not have to wait
+for the disk (or the broadening). It follows which slider moved last and in which direction, and loads the models
+further in that direction first.
+
+Usage:
+prefetcher = NeighbourPrefetcher(grid_index, store)
+profiles = prefetcher.get_many(rows)   # instead of store[rows]
+prefetcher.moved(values)               # after every slider change
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import numpy as np
+
+from profile_store import ProfileStore
+
+
+class NeighbourPrefetcher:
+    """
+    Bounded cache of (preprocessed) models, filled by a thread pool with the neighbours of the current models.
+    """
+    def __init__(self, grid_index, line_profiles, steps=2, max_cached_models=256, workers=2, preprocess=None):
+        """
+        :param grid_index: ParameterGridIndex of the grid
+        :param line_profiles: Array or ProfileStore with the profiles
+        :param steps: How many steps ahead to load on every parameter axis
+        :param max_cached_models: Maximum number of models in the cache
+        :param workers: Number of threads
+        :param preprocess: Optional function(profiles, key) that is applied to each loaded model, for example the
+                           broadening. key is given to get/get_many (for example vsini), models are cached per key.
+        """
+        self.grid_index = grid_index
+        self.line_profiles = line_profiles
+        self.steps = steps
+        self.max_cached_models = max_cached_models
+        self.preprocess = preprocess
+        self.executor = ThreadPoolExecutor(workers)
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()  # (row, key): profiles, least recently used first
+        self.pending = {}           # (row, key): future
+        self.key = None
+        self.last_positions = None
+        self.last_axis = None       # The axis that moved last
+        self.last_direction = 1
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, row, key):
+        """Reads and preprocesses one model"""
+        if isinstance(self.line_profiles, ProfileStore):
+            # Straight from the memory map, the cache of the store is not made for multiple threads
+            profiles = np.array(self.line_profiles.data[row])
+        else:
+            profiles = np.array(self.line_profiles[row])
+        if self.preprocess is not None:
+            profiles = self.preprocess(profiles, key)
+        return profiles
+
+    def store(self, row, key, profiles):
+        with self.lock:
+            self.cache[(row, key)] = profiles
+            self.cache.move_to_end((row, key))
+            while len(self.cache) > self.max_cached_models:
+                self.cache.popitem(last=False)
+
+    def fetch(self, row, key):
+        """Loads a model in the background and puts it in the cache"""
+        try:
+            self.store(row, key, self.load(row, key))
+        finally:
+            with self.lock:
+                self.pending.pop((row, key), None)
+
+    def get(self, row, key=None):
+        """
+        The (preprocessed) profiles of a model, from the cache if possible.
+        """
+        row = int(row)
+        with self.lock:
+            profiles = self.cache.get((row, key))
+            if profiles is not None:
+                self.cache.move_to_end((row, key))
+            future = self.pending.get((row, key))
+        if profiles is not None:
+            self.hits += 1
+            return profiles
+        if future is not None:
+            if future.cancel():
+                # Not started yet, it is loaded here instead
+                with self.lock:
+                    self.pending.pop((row, key), None)
+            else:
+                # Already being loaded, wait for it
+                future.result()
+                with self.lock:
+                    profiles = self.cache.get((row, key))
+                if profiles is not None:
+                    self.hits += 1
+                    return profiles
+        self.misses += 1
+        profiles = self.load(row, key)
+        self.store(row, key, profiles)
+        return profiles
+
+    def get_many(self, rows, key=None):
+        """The profiles of multiple models, like line_profiles[rows]"""
+        self.key = key
+        return np.stack([self.get(row, key) for row in rows])
+
+    def targets(self, positions):
+        """
+        The grid positions to load, the ones in the direction of the last move first.
+        """
+        targets = []
+        axes = list(range(self.grid_index.n_params))
+        if self.last_axis is not None:
+            axes.remove(self.last_axis)
+            axes.insert(0, self.last_axis)
+        for step in range(1, self.steps + 1):
+            for axis in axes:
+                directions = [self.last_direction, -self.last_direction] if axis == self.last_axis else [1, -1]
+                for direction in directions:
+                    target = list(positions)
+                    target[axis] += direction * step
+                    if 0 <= target[axis] < self.grid_index.shape[axis]:
+                        targets.append((axis, target))
+        return targets
+
+    def moved(self, values, free_axis=None):
+        """
+        Tells the prefetcher where the sliders are now. Loads the models around it and cancels the loading of models
+        that are no longer close.
+        :param values: The slider values of the grid parameters
+        :param free_axis: The axis of the selected radio button (all models along it are shown), None if there is none
+        """
+        positions = self.grid_index.positions_of(values)
+        if positions is None:
+            return
+        if self.last_positions is not None:
+            moves = [axis for axis in range(len(positions)) if positions[axis] != self.last_positions[axis]]
+            if len(moves) == 1:
+                self.last_axis = moves[0]
+                self.last_direction = 1 if positions[moves[0]] > self.last_positions[moves[0]] else -1
+        self.last_positions = positions
+
+        wanted = []
+        for axis, target in self.targets(positions):
+            if axis == free_axis:
+                continue  # Those models are already shown
+            if free_axis is None:
+                row = self.grid_index.row([self.grid_index.values[i][p] for i, p in enumerate(target)])
+                rows = [] if row is None else [row]
+            else:
+                rows = self.grid_index.axis_rows(free_axis, [self.grid_index.values[i][p]
+                                                             for i, p in enumerate(target)])
+            wanted += [(int(row), self.key) for row in rows]
+        wanted = dict.fromkeys(list(dict.fromkeys(wanted))[:self.max_cached_models // 2])
+
+        with self.lock:
+            # Stop loading models that are no longer needed
+            for item, future in list(self.pending.items()):
+                if item not in wanted and future.cancel():
+                    del self.pending[item]
+            new = [item for item in wanted if item not in self.cache and item not in self.pending]
+            for item in new:
+                self.pending[item] = self.executor.submit(self.fetch, *item)
+
+    def shutdown(self):
+        """Stops the threads"""
+        with self.lock:
+            for future in self.pending.values():
+                future.cancel()
+            self.pending = {}
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,175 @@
+"""
+On disk storage for line profiles of model grids that do not fit in memory.
+The profiles are saved as a .npy file that is memory mapped. The model axis comes first and the file is in C order, so
+all lines of one model are next to each other on disk and reading a model is a single read. Only the models that are
+looked at are read, and the most recently viewed ones are kept in memory.
+
+Usage:
+store = ProfileStore.from_array("grid.npy", line_profiles)   # or ProfileStore.create(...) and fill it model by model
+store = ProfileStore("grid.npy")
+InteractivePlot(fig, store, model_parameters, ...)           # instead of the line_profiles array
+
+For compact profiles (see compact_profiles in interactive_line_profiles.py) the wavelengths are saved next to the flux:
+store = ProfileStore.from_array("grid.npy", flux, wavelengths=wavelengths)
+InteractivePlot(fig, store, model_parameters, ..., wavelengths=store.wavelengths)
+"""
+from collections import OrderedDict
+import os
+import numpy as np
+
+
+def wavelengths_path(path):
+    """The file next to the profiles in which the wavelengths of the compact profiles are saved"""
+    return os.path.splitext(path)[0] + "_wavelengths.npy"
+
+
+class ProfileStore:
+    """
+    Memory mapped array of line profiles that can be indexed by model like the line_profiles array,
+    store[row] gives the lines of one model, store[rows] of multiple models.
+    """
+    def __init__(self, path, max_cached_models=256, mode="r"):
+        """
+        :param path: The .npy file with the profiles, shape: (N_models, ...)
+        :param max_cached_models: Maximum number of models that are kept in memory
+        :param mode: Mode of the memory map, "r" for read only, "r+" to be able to write models
+        """
+        self.path = path
+        self.data = np.load(path, mmap_mode=mode)
+        # The wavelengths of compact profiles, None if the profiles include the wavelengths
+        self.wavelengths = None
+        if os.path.exists(wavelengths_path(path)):
+            self.wavelengths = list(np.load(wavelengths_path(path)))
+        self.max_cached_models = max_cached_models
+        self.cache = OrderedDict()  # Least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def create(cls, path, shape, dtype=float, wavelengths=None, **kwargs):
+        """
+        Makes a new (empty) store on disk, which can be filled with store[row] = profiles.
+        :param shape: Shape of the profiles array, the first dimension is the number of models
+        :param wavelengths: The wavelengths of each line, if the profiles only contain the flux
+        """
+        data = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=tuple(shape))
+        del data  # Makes sure the header is written
+        if wavelengths is not None:
+            np.save(wavelengths_path(path), np.asarray(wavelengths))
+        elif os.path.exists(wavelengths_path(path)):
+            os.remove(wavelengths_path(path))
+        return cls(path, mode="r+", **kwargs)
+
+    @classmethod
+    def from_array(cls, path, line_profiles, chunk_models=1024, **kwargs):
+        """
+        Writes an array (or anything that can be indexed by model) to a new store.
+        :param chunk_models: Number of models that are copied at once
+        """
+        n_models = len(line_profiles)
+        first = np.asarray(line_profiles[0])
+        store = cls.create(path, (n_models,) + first.shape, dtype=first.dtype, **kwargs)
+        for start in range(0, n_models, chunk_models):
+            store.data[start:start + chunk_models] = line_profiles[start:start + chunk_models]
+        store.flush()
+        return store
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def ndim(self):
+        return self.data.ndim
+
+    @property
+    def nbytes(self):
+        """Size of the profiles on disk"""
+        return self.data.nbytes
+
+    @property
+    def cached_nbytes(self):
+        """Memory used by the cached models"""
+        return sum(model.nbytes for model in self.cache.values())
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getstate__(self):
+        # Only the file is sent to other processes, not the data
+        return {"path": self.path, "max_cached_models": self.max_cached_models}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], max_cached_models=state["max_cached_models"])
+
+    def read(self, rows):
+        """
+        Reads models that are not in the cache from disk, in the order in which they are on disk, and caches them.
+        """
+        rows = sorted(set(rows) - set(self.cache))
+        if not rows:
+            return
+        self.misses += len(rows)
+        for row, model in zip(rows, self.data[rows]):
+            model.flags.writeable = False  # The cached models are shared, so they should not be changed
+            self.cache[row] = model
+        while len(self.cache) > self.max_cached_models:
+            self.cache.popitem(last=False)
+
+    def model(self, row):
+        """
+        The profiles of a single model
+        :return: array with shape: shape[1:], do not change it, it is shared with the cache
+        """
+        row = int(row)
+        if row < 0:
+            row += len(self)
+        if row in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(row)
+        else:
+            self.read([row])
+        return self.cache[row]
+
+    def models(self, rows):
+        """
+        The profiles of multiple models
+        :return: array with shape: (len(rows),) + shape[1:]
+        """
+        rows = np.arange(len(self))[rows] if isinstance(rows, slice) else np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        rows = [int(row) + len(self) if row < 0 else int(row) for row in rows]
+        if len(rows) > self.max_cached_models:
+            # Does not fit in the cache, read it directly
+            return np.asarray(self.data[rows])
+        hits = [row for row in rows if row in self.cache]
+        self.hits += len(hits)
+        # The cached ones go to the end first, so reading the others cannot push them out of the cache
+        for row in hits:
+            self.cache.move_to_end(row)
+        self.read(rows)
+        return np.stack([self.cache[row] for row in rows]) if rows else np.empty((0,) + self.shape[1:], self.dtype)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self.model(key)
+        return self.models(key)
+
+    def __setitem__(self, row, profiles):
+        """Writes the profiles of one model (needs mode "r+")"""
+        row = int(row)
+        self.data[row] = profiles
+        self.cache.pop(row, None)
+
+    def flush(self):
+        """Makes sure everything that is written ends up on disk"""
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+
+    def clear_cache(self):
+        self.cache.clear()
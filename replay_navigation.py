@@ -0,0 +1,318 @@
+"""
+Replays a sequence of key presses and mouse clicks on the presentation without a screen, to see how long it takes
+before the next frame is ready after each event. The events can come from a script file or from a recording of a real
+run of the talk (python the_talk.py --record my_talk.json).
+
+Usage:
+python replay_navigation.py                             # Replays the built-in walk through the slides
+python replay_navigation.py --script my_talk.json --output replay_results.json
+
+Script files are json with a start slide and a list of events. Positions are in figure coordinates (0 to 1):
+{"start_slide": 0,
+ "events": [{"type": "key", "key": "right"},
+            {"type": "click", "x": 0.4, "y": 0.5, "button": 1},
+            {"type": "drag", "start": [0.1, 0.1], "end": [0.4, 0.3], "button": 1, "steps": 5},
+            {"type": "press", "x": 0.4, "y": 0.5, "button": 1},
+            {"type": "motion", "x": 0.45, "y": 0.5, "button": 1},
+            {"type": "release", "x": 0.5, "y": 0.5, "button": 1},
+            {"type": "frames", "n": 10},
+            {"type": "slide", "n": 0}]}
+"frames" advances running animations (the N-body simulation) by a number of frames.
+"slide" jumps straight to a slide.
+"""
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib.backend_bases import KeyEvent, MouseEvent
+import numpy as np
+import json
+import mmap
+import sys
+import time
+import tracemalloc
+try:
+    import resource  # Not on windows
+except ImportError:
+    resource = None
+
+
+# Where the first slider of the slider slide is, in figure coordinates
+SLIDER_Y = 0.12
+
+
+def default_script(n_slides=12):
+    """
+    Makes a walk through the whole talk with the things you would typically do on each slide.
+    :param n_slides: The number of slides in the presentation
+    :return: dictionary with the script
+    """
+    events = []
+    for slide in range(n_slides):
+        if slide == 0:
+            # Shoot some particles into the N-body simulation and let it run
+            events.append({"type": "frames", "n": 5})
+            for x in [0.3, 0.5, 0.7]:
+                events.append({"type": "drag", "start": [x, 0.3], "end": [x + 0.05, 0.25], "button": 1, "steps": 3})
+                events.append({"type": "frames", "n": 5})
+        elif slide in (1, 3, 8):
+            events += [{"type": "key", "key": " "}] * {1: 4, 3: 1, 8: 9}[slide]
+        elif slide == 4:
+            # Draw some subplots
+            events.append({"type": "drag", "start": [0.1, 0.5], "end": [0.4, 0.9], "button": 1, "steps": 5})
+            events.append({"type": "drag", "start": [0.5, 0.1], "end": [0.9, 0.4], "button": 1, "steps": 5})
+        elif slide == 6:
+            # Move the first slider around
+            for x in [0.1, 0.2, 0.3, 0.15]:
+                events.append({"type": "click", "x": x, "y": SLIDER_Y, "button": 1})
+        events.append({"type": "key", "key": "d"})
+        events.append({"type": "key", "key": "d"})
+        events.append({"type": "key", "key": "right"})
+    # And back a few slides, with a redraw
+    events += [{"type": "key", "key": "left"}] * 3
+    events.append({"type": "key", "key": "r"})
+    return {"start_slide": 0, "events": events}
+
+
+class EventRecorder:
+    """
+    Records the key presses and mouse clicks on a figure into a script for the ReplayDriver.
+    The script is written when the figure is closed, or when save is called.
+    """
+    def __init__(self, fig, path, start_slide=0):
+        self.fig = fig
+        self.path = path
+        self.script = {"start_slide": start_slide, "events": []}
+        self.button_down = None
+        canvas = fig.canvas
+        self.cids = [canvas.mpl_connect("key_press_event", self.on_key),
+                     canvas.mpl_connect("button_press_event", self.on_mouse),
+                     canvas.mpl_connect("button_release_event", self.on_mouse),
+                     canvas.mpl_connect("motion_notify_event", self.on_mouse),
+                     canvas.mpl_connect("close_event", self.save)]
+
+    def on_key(self, event):
+        self.script["events"].append({"type": "key", "key": event.key})
+
+    def on_mouse(self, event):
+        """Stores presses and releases, and movement while a button is pressed"""
+        if event.name == "motion_notify_event" and self.button_down is None:
+            return
+        x, y = self.fig.transFigure.inverted().transform((event.x, event.y))
+        if event.name == "button_press_event":
+            self.button_down = int(event.button)
+            name = "press"
+        elif event.name == "button_release_event":
+            name = "release"
+        else:
+            name = "motion"
+        self.script["events"].append({"type": name, "x": float(x), "y": float(y), "button": self.button_down})
+        if name == "release":
+            self.button_down = None
+
+    def save(self, *args):
+        with open(self.path, "w") as f:
+            json.dump(self.script, f, indent=1)
+        print(f"Recorded {len(self.script['events'])} events to {self.path}")
+
+
+class ReplayDriver:
+    """
+    Feeds the events of a script to a presentation that is not shown on screen and measures the time from the event
+    until the frame is drawn, and the memory use during the run.
+    """
+    def __init__(self, pres, frames_per_event=0, trace_memory=False):
+        """
+        :param pres: A ThePresentation, made with show=False
+        :param frames_per_event: Number of animation frames to run after each event (if there is an animation)
+        :param trace_memory: Use tracemalloc to follow the memory that python allocates. More precise than the
+                             memory use of the whole process, but it makes everything a lot slower.
+        """
+        self.pres = pres
+        self.fig = pres.fig
+        self.canvas = pres.fig.canvas
+        self.frames_per_event = frames_per_event
+        self.trace_memory = trace_memory
+        self.frame_number = 0
+
+        # Results
+        self.latencies = {}  # event type: list of latencies in seconds
+        self.frame_times = []
+        self.memory = []  # Memory growth after each event in bytes
+
+    def memory_use(self):
+        """
+        Current memory use in bytes, from tracemalloc if it is used, otherwise the resident memory of the process.
+        Without /proc (not on linux) it is the peak memory use instead, and on windows it is always 0 (use
+        trace_memory there).
+        """
+        if self.trace_memory:
+            return tracemalloc.get_traced_memory()[0]
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * mmap.PAGESIZE
+        except OSError:
+            pass
+        if resource is None:
+            return 0
+        # ru_maxrss is in bytes on mac and in kB on the other unixes
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    def to_pixels(self, x, y):
+        """Figure coordinates to display coordinates"""
+        return self.fig.transFigure.transform((x, y))
+
+    def mouse_event(self, name, x, y, button):
+        """Sends a mouse event through the canvas, so all the connected widgets get it"""
+        px, py = self.to_pixels(x, y)
+        event = MouseEvent(name, self.canvas, px, py, button=button)
+        self.canvas.callbacks.process(name, event)
+
+    def dispatch(self, event):
+        """
+        Sends a single script event to the figure
+        """
+        kind = event["type"]
+        if kind == "key":
+            x, y = self.to_pixels(0.5, 0.5)
+            self.pres.on_press(KeyEvent("key_press_event", self.canvas, event["key"], x, y))
+        elif kind == "click":
+            self.mouse_event("button_press_event", event["x"], event["y"], event.get("button", 1))
+            self.mouse_event("button_release_event", event["x"], event["y"], event.get("button", 1))
+        elif kind == "drag":
+            button = event.get("button", 1)
+            (x0, y0), (x1, y1) = event["start"], event["end"]
+            self.mouse_event("button_press_event", x0, y0, button)
+            for frac in np.linspace(0, 1, event.get("steps", 5) + 1)[1:]:
+                self.mouse_event("motion_notify_event", x0 + (x1 - x0) * frac, y0 + (y1 - y0) * frac, button)
+            self.mouse_event("button_release_event", x1, y1, button)
+        elif kind == "slide":
+            self.pres.go_to_slide(event["n"])
+        elif kind in ("press", "motion", "release"):
+            name = {"press": "button_press_event", "motion": "motion_notify_event",
+                    "release": "button_release_event"}[kind]
+            self.mouse_event(name, event["x"], event["y"], event.get("button", 1))
+        else:
+            raise ValueError(f"Unknown event type in script: {kind}")
+
+    def animation_running(self):
+        """Only the title slide has an animation at the moment"""
+        return self.pres.slide_dict[self.pres.current_slide] == self.pres.title_slide
+
+    def run_frames(self, n):
+        """Runs n frames of the animation, like the timer of the animation would on screen."""
+        if not self.animation_running():
+            return
+        for i in range(n):
+            t0 = time.perf_counter()
+            self.pres.animate_grav(self.frame_number)
+            self.canvas.draw()
+            self.frame_times.append(time.perf_counter() - t0)
+            self.frame_number += 1
+
+    def run(self, script):
+        """
+        Replays the script.
+        :param script: dictionary with the events, see the module docstring
+        :return: dictionary with the results, see report
+        """
+        if script.get("start_slide", 0) != self.pres.current_slide:
+            self.pres.go_to_slide(script["start_slide"])
+        self.canvas.draw()
+
+        if self.trace_memory:
+            tracemalloc.start()
+        start_memory = self.memory_use()
+        peak_memory = 0
+        for event in script["events"]:
+            if event["type"] == "frames":
+                self.run_frames(event["n"])
+                continue
+
+            t0 = time.perf_counter()
+            self.dispatch(event)
+            # What the event loop would do on screen: draw if anything asked for it.
+            if self.fig.stale:
+                self.canvas.draw()
+            latency = time.perf_counter() - t0
+
+            name = event["type"] if event["type"] != "key" else f"key '{event['key']}'"
+            self.latencies.setdefault(name, []).append(latency)
+            self.memory.append(self.memory_use() - start_memory)
+            peak_memory = max(peak_memory, self.memory[-1])
+            self.run_frames(self.frames_per_event)
+
+        if self.trace_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1] - start_memory
+            tracemalloc.stop()
+        return self.report(peak_memory)
+
+    def report(self, peak_memory):
+        """
+        Summarizes the latencies with percentiles
+        :return: dictionary with the percentiles (in ms) per event type and overall, and memory growth (in bytes)
+        """
+        def percentiles(values):
+            values = np.array(values) * 1e3
+            return {"n": len(values), "p50": float(np.percentile(values, 50)),
+                    "p95": float(np.percentile(values, 95)), "p99": float(np.percentile(values, 99)),
+                    "max": float(np.max(values))}
+
+        all_latencies = [latency for values in self.latencies.values() for latency in values]
+        results = {"all_events": percentiles(all_latencies),
+                   "per_event": {name: percentiles(values) for name, values in self.latencies.items()},
+                   "memory_growth": int(self.memory[-1]) if self.memory else 0,
+                   "memory_peak": int(peak_memory),
+                   "memory_per_event": [int(m) for m in self.memory]}
+        if self.frame_times:
+            results["animation_frames"] = percentiles(self.frame_times)
+        return results
+
+
+def print_report(results):
+    """Prints the results in a readable table"""
+    rows = [("all events", results["all_events"])] + list(results["per_event"].items())
+    if "animation_frames" in results:
+        rows.append(("animation frames", results["animation_frames"]))
+    print(f"{'event':<20} {'n':>5} {'p50 [ms]':>10} {'p95 [ms]':>10} {'p99 [ms]':>10} {'max [ms]':>10}")
+    for name, stats in rows:
+        print(f"{name:<20} {stats['n']:>5} {stats['p50']:>10.1f} {stats['p95']:>10.1f} {stats['p99']:>10.1f} "
+              f"{stats['max']:>10.1f}")
+    print(f"Memory growth over the run: {results['memory_growth'] / 1e6:.2f} MB "
+          f"(peak {results['memory_peak'] / 1e6:.2f} MB)")
+
+
+if __name__ == "__main__":
+    import argparse
+    # No screen needed. Only here, the talk also imports this file for the EventRecorder while it runs on screen
+    matplotlib.use("Agg")
+    from the_talk import ThePresentation
+
+    parser = argparse.ArgumentParser(description="Replay key presses and clicks on the talk and measure latency.")
+    parser.add_argument("--script", default=None, help="Script or recording to replay (json), "
+                                                       "default is a walk through all slides")
+    parser.add_argument("--frames", type=int, default=1, help="Animation frames to run after each event")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of times to replay the script")
+    parser.add_argument("--output", default=None, help="File to write the results to (json)")
+    parser.add_argument("--latex", action="store_true", help="Allow latex rendering (requires latex)")
+    parser.add_argument("--tracemalloc", action="store_true", help="Trace python memory allocations (slow)")
+    args = parser.parse_args()
+
+    pres = ThePresentation(start_slide=0, allow_latex=args.latex, show=False)
+    if args.script is None:
+        script = default_script(len(pres.slide_dict))
+    else:
+        with open(args.script) as f:
+            script = json.load(f)
+    # Start at the same slide for every repeat
+    restart = [{"type": "slide", "n": script.get("start_slide", 0)}]
+    script = dict(script, events=(script["events"] + restart) * args.repeat)
+
+    driver = ReplayDriver(pres, frames_per_event=args.frames, trace_memory=args.tracemalloc)
+    results = driver.run(script)
+    print_report(results)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"Results written to {args.output}")
+    plt.close(pres.fig)
@@ -16,6 +16,7 @@ class Ruler:
     def __init__(self, fig=None):
         self.fig = fig or plt.gcf()
         self.ax = None
+        self.cid = None
         self.show()
 
     def show(self):
@@ -48,7 +49,14 @@ class Ruler:
             self.ax = ax
 
         self.update()
-        plt.connect("resize_event", self.update)
+        if self.cid is None:
+            self.cid = self.fig.canvas.mpl_connect("resize_event", self.update)
+
+    def disconnect(self):
+        """ Stops following the resize events of the figure """
+        if self.cid is not None:
+            self.fig.canvas.mpl_disconnect(self.cid)
+            self.cid = None
 
     def update(self, *args):
 
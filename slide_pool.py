@@ -0,0 +1,217 @@
+"""
+Keeps slides alive after you leave them, so coming back to a slide is instant and the slide is how you left it
+(slider positions, drawn subplots, markers, ...).
+The artists of a slide stay on the figure but are hidden and its widgets are switched off. When going back to the
+slide they are shown and switched on again. To limit the memory use, the least recently visited slides are thrown
+away when the pool gets too big.
+"""
+from collections import OrderedDict
+import numpy as np
+from matplotlib.artist import Artist
+from matplotlib.collections import Collection
+from matplotlib.image import AxesImage
+from matplotlib.lines import Line2D
+from matplotlib.widgets import Widget, RadioButtons, CheckButtons
+
+
+# Rough memory use of an artist apart from its data (the python objects, the transforms, ...)
+ARTIST_OVERHEAD = 2000
+
+# The lists in which a figure keeps the things that are not axes
+FIGURE_LISTS = ["texts", "lines", "patches", "images", "legends", "artists"]
+
+
+def nbytes(obj, seen=None):
+    """
+    Rough estimate of the memory used by the numpy arrays in obj (lists, tuples, dicts and objects are searched).
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (list, tuple, set)):
+        return sum(nbytes(item, seen) for item in obj)
+    if isinstance(obj, dict):
+        return sum(nbytes(item, seen) for item in obj.values())
+    if isinstance(obj, Artist):  # The artists are counted separately
+        return 0
+    if hasattr(obj, "__dict__"):
+        return nbytes(vars(obj), seen)
+    return 0
+
+
+class PooledSlide:
+    """Everything that is needed to bring back a slide."""
+    def __init__(self, artists, widgets, rulers, attributes, subplotpars, nbytes):
+        self.artists = artists  # list of (artist, was it visible)
+        self.widgets = widgets
+        self.rulers = rulers
+        self.attributes = attributes
+        self.subplotpars = subplotpars
+        self.nbytes = nbytes
+
+
+def set_widget_active(widget, active):
+    """
+    Switches a widget on or off. RadioButtons and CheckButtons use set_active to select a button, so for those the
+    basic Widget version is used.
+    """
+    if isinstance(widget, (RadioButtons, CheckButtons)):
+        Widget.set_active(widget, active)
+    else:
+        widget.set_active(active)
+
+
+def remove_artist(fig, artist):
+    """
+    Removes an artist from the figure. Colorbars whose mappable has been replaced (update_normal) cannot always remove
+    themselves, those axes are taken off the figure directly.
+    """
+    try:
+        artist.remove()
+    except (AttributeError, ValueError):
+        if artist in fig.axes:
+            fig.delaxes(artist)
+
+
+def estimate_nbytes(artists, extra=None):
+    """
+    Rough estimate of the memory that is used by the artists (and everything in them) and the extra data.
+    """
+    total = nbytes(extra)
+    for artist in artists:
+        for child in artist.findobj():
+            total += ARTIST_OVERHEAD
+            if isinstance(child, Line2D):
+                total += child.get_xydata().nbytes
+            elif isinstance(child, Collection):
+                total += child.get_offsets().nbytes + sum(path.vertices.nbytes for path in child.get_paths())
+            elif isinstance(child, AxesImage) and child.get_array() is not None:
+                total += child.get_array().nbytes
+    return total
+
+
+class SlidePool:
+    """
+    Pool of hidden slides on a figure, with least recently used eviction.
+
+    Usage:
+    pool = SlidePool(fig, max_bytes=500e6)
+    pool.park(slide_number, widgets=[...], attributes={...})  # hides whatever is on the figure and not yet pooled
+    ...
+    pool.clear_unpooled()                                     # instead of fig.clf()
+    if slide_number in pool:
+        pooled = pool.restore(slide_number)
+    """
+
+    def __init__(self, fig, max_bytes=500e6, max_slides=None, on_evict=None):
+        """
+        :param fig: The figure on which the slides are drawn
+        :param max_bytes: Maximum estimated memory use of the pooled slides together
+        :param max_slides: Maximum number of pooled slides, None for no maximum
+        :param on_evict: Function that is called with (slide, pooled slide) when a slide is thrown away
+        """
+        self.fig = fig
+        self.max_bytes = max_bytes
+        self.max_slides = max_slides
+        self.on_evict = on_evict
+        self.slides = OrderedDict()  # Least recently used first
+
+    def __contains__(self, slide):
+        return slide in self.slides
+
+    def __len__(self):
+        return len(self.slides)
+
+    @property
+    def nbytes(self):
+        return sum(pooled.nbytes for pooled in self.slides.values())
+
+    def figure_content(self):
+        """All the artists that are directly on the figure."""
+        content = list(self.fig.axes)
+        for name in FIGURE_LISTS:
+            content += list(getattr(self.fig, name))
+        return content
+
+    def pooled_ids(self):
+        """The ids of all artists that belong to a pooled slide"""
+        return {id(artist) for pooled in self.slides.values() for artist, visible in pooled.artists}
+
+    def unpooled_content(self):
+        """The artists on the figure that do not belong to a pooled slide, so the ones of the current slide"""
+        pooled = self.pooled_ids()
+        return [artist for artist in self.figure_content() if id(artist) not in pooled]
+
+    def park(self, slide, widgets=(), rulers=(), attributes=None, extra=None):
+        """
+        Hides everything of the current slide and switches off its widgets.
+        :param slide: The slide number
+        :param widgets: The matplotlib widgets of the slide
+        :param rulers: The rulers on the slide, these are disconnected when the slide is thrown away
+        :param attributes: Dictionary with anything else that is needed to bring back the slide
+        :param extra: Extra data that belongs to the slide, only used to estimate the memory use
+        """
+        artists = self.unpooled_content()
+        states = [(artist, artist.get_visible()) for artist in artists]
+        for artist in artists:
+            artist.set_visible(False)
+        for widget in widgets:
+            set_widget_active(widget, False)
+
+        pars = self.fig.subplotpars
+        subplotpars = {name: getattr(pars, name) for name in ["left", "bottom", "right", "top", "wspace", "hspace"]}
+        self.slides[slide] = PooledSlide(states, list(widgets), list(rulers), attributes or {}, subplotpars,
+                                         estimate_nbytes(artists, extra))
+        self.evict()
+
+    def restore(self, slide):
+        """
+        Shows a pooled slide again. The slide is no longer part of the pool after this.
+        :return: The PooledSlide with the widgets and attributes of the slide
+        """
+        pooled = self.slides.pop(slide)
+        for artist, visible in pooled.artists:
+            artist.set_visible(visible)
+        for widget in pooled.widgets:
+            set_widget_active(widget, True)
+        # Other slides can have moved the subplots around, this puts them back
+        self.fig.subplots_adjust(**pooled.subplotpars)
+        self.fig.stale = True
+        return pooled
+
+    def clear_unpooled(self):
+        """
+        Removes everything of the current slide from the figure, like fig.clf() but the pooled slides stay.
+        """
+        for artist in self.unpooled_content():
+            remove_artist(self.fig, artist)
+        self.fig.stale = True
+
+    def evict(self):
+        """Throws away the least recently used slides until the pool is small enough"""
+        while self.slides and (self.nbytes > self.max_bytes or
+                               (self.max_slides is not None and len(self.slides) > self.max_slides)):
+            slide, pooled = self.slides.popitem(last=False)
+            self.release(slide, pooled)
+
+    def release(self, slide, pooled):
+        """Removes a pooled slide from the figure and disconnects its widgets"""
+        # First, while the widgets are still on the figure (without their axes they have no canvas to disconnect from)
+        if self.on_evict is not None:
+            self.on_evict(slide, pooled)
+        for widget in pooled.widgets:
+            widget.disconnect_events()
+        for ruler in pooled.rulers:
+            ruler.disconnect()
+        for artist, visible in pooled.artists:
+            remove_artist(self.fig, artist)
+
+    def clear(self):
+        """Throws away all pooled slides"""
+        while self.slides:
+            slide, pooled = self.slides.popitem(last=False)
+            self.release(slide, pooled)
@@ -0,0 +1,234 @@
+"""
+Makes a movie of an InteractivePlot (interactive_line_profiles.py) while the sliders move along a path through the
+parameter space, for example one parameter going from its lowest to its highest value while the others stay fixed.
+Nothing is shown on screen: the frames are drawn with Agg by a pool of processes, which each make the plot once and then
+draw a chunk of consecutive frames. The profiles are memory mapped (a ProfileStore, an array is saved to one first), so
+all processes read the same file instead of each getting a copy of the grid.
+The frames are saved as an image sequence by the processes themselves, or are sent in order to ffmpeg.
+
+Usage:
+config = PlotConfig(store, model_parameters, parameter_names, unique_params, line_names, line_collection=True)
+frames = sweep_path({"a": 1, "b": 2, "c": 3, "d": 4}, "a", np.arange(1, 6), back=True)
+render_movie(config, frames, "frames/frame_{:04d}.png", processes=4)   # or "sweep.mp4" (needs ffmpeg)
+
+or, for the grid of the slider slide:
+python sweep_movie.py --parameter a --output frames/frame_{:04d}.png --processes 4
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import numpy as np
+
+from profile_store import ProfileStore
+
+
+class PlotConfig:
+    """
+    Everything that is needed to make the same InteractivePlot in another process: the arguments of InteractivePlot,
+    the extra spectrum of init_plot and the size of the frames.
+    """
+    def __init__(self, line_profiles, model_parameters, parameter_names, unique_params, line_names, figsize=(16, 9),
+                 dpi=100, extra_spectrum=(None, None, None), **options):
+        """
+        :param line_profiles: ProfileStore or array with the profiles
+        :param figsize: Size of the figure in inches, the frames are figsize * dpi pixels
+        :param extra_spectrum: (wave, flux, error) of an observed spectrum to show, see InteractivePlot.init_plot
+        :param options: Other keyword arguments of InteractivePlot (line_collection, wavelengths, ...), blit is ignored
+        """
+        self.line_profiles = line_profiles
+        self.model_parameters = model_parameters
+        self.parameter_names = parameter_names
+        self.unique_params = unique_params
+        self.line_names = line_names
+        self.figsize = figsize
+        self.dpi = dpi
+        self.extra_spectrum = extra_spectrum
+        self.options = options
+
+    @property
+    def frame_size(self):
+        """Width and height of a frame in pixels"""
+        return int(round(self.figsize[0] * self.dpi)), int(round(self.figsize[1] * self.dpi))
+
+    def make_plot(self):
+        """Makes the figure and the InteractivePlot (with the Agg backend)"""
+        import matplotlib
+        matplotlib.use("Agg", force=True)
+        import matplotlib.pyplot as plt
+        from interactive_line_profiles import InteractivePlot
+
+        fig = plt.figure(figsize=self.figsize, dpi=self.dpi)
+        # Every slider change is drawn right away, the frames do not wait for a timer. Every frame is a full draw, a
+        # saved background only gets in the way when nothing is shown on screen
+        options = dict(self.options, coalesce_updates=False, blit=False)
+        plot = InteractivePlot(fig, self.line_profiles, self.model_parameters, self.parameter_names,
+                               self.unique_params, self.line_names, **options)
+        plot.init_plot(*self.extra_spectrum)
+        fig.canvas.draw()
+        return plot
+
+
+def sweep_path(start, parameter, values, back=False, radio="None"):
+    """
+    The frames of one parameter moving through values while the others stay where they are.
+    :param start: Dictionary of parameter name: value for all sliders
+    :param parameter: The parameter that moves
+    :param values: The values it moves through (in between grid values only makes sense with interpolate=True)
+    :param back: Also move back again to the first value
+    :param radio: The selected radio button ("None" or a parameter to show all models of)
+    :return: list of frames, dictionaries of parameter name: value (and "radio")
+    """
+    values = list(values)
+    if back:
+        values += values[-2::-1]
+    return [dict(start, **{parameter: value, "radio": radio}) for value in values]
+
+
+def set_state(plot, frame):
+    """
+    Moves the sliders and radio buttons of the plot to a frame and updates it once.
+    :param frame: Dictionary of parameter name: value, and optionally "radio"
+    """
+    for name, slider in zip(plot.parameter_names, plot.sliders):
+        if name in frame and slider.val != frame[name]:
+            # Only one update for all sliders together, and no drawing of the sliders on their own
+            slider.eventson, slider.drawon, drawon = False, False, slider.drawon
+            slider.set_val(frame[name])
+            slider.eventson, slider.drawon = True, drawon
+    radio = plot.radio_buttons
+    if "radio" in frame and radio.value_selected != frame["radio"]:
+        radio.eventson = False
+        radio.set_active([label.get_text() for label in radio.labels].index(frame["radio"]))
+        radio.eventson = True
+    plot.update(None)
+
+
+# The plot of a worker process, made once by init_worker
+worker_plot = None
+
+
+def init_worker(config):
+    global worker_plot
+    worker_plot = config.make_plot()
+
+
+def render_frames(start, frames, pattern=None):
+    """
+    Draws consecutive frames in a worker.
+    :param start: Number of the first frame
+    :param pattern: File name with a {} for the frame number to save the frames to, None to send back the pixels
+    :return: list with the RGBA bytes of the frames, or the file names
+    """
+    import matplotlib.image
+    results = []
+    for i, frame in enumerate(frames):
+        set_state(worker_plot, frame)
+        canvas = worker_plot.fig.canvas
+        if worker_plot.fig.stale:
+            canvas.draw()
+        rgba = np.asarray(canvas.buffer_rgba())
+        if pattern is None:
+            results.append(rgba.tobytes())
+        else:
+            path = pattern.format(start + i)
+            matplotlib.image.imsave(path, rgba)
+            results.append(path)
+    return results
+
+
+def ffmpeg_process(path, frame_size, fps):
+    """Starts ffmpeg to encode raw RGBA frames from stdin into a movie"""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg was not found, save the frames as images instead (for example frame_{:04d}.png)")
+    width, height = frame_size
+    command = [ffmpeg, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{width}x{height}",
+               "-framerate", str(fps), "-i", "-",
+               # h264 needs an even width and height
+               "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", path]
+    return subprocess.Popen(command, stdin=subprocess.PIPE)
+
+
+def render_movie(config, frames, output, processes=None, fps=30, chunk_frames=8, verbose=True):
+    """
+    Draws all frames in a pool of processes and saves them.
+    :param config: PlotConfig of the plot
+    :param frames: List of frames, see sweep_path
+    :param output: File name with a {} for the frame number (an image sequence, written by the workers), or the
+                   name of a movie file that ffmpeg makes (for example sweep.mp4)
+    :param processes: Number of processes, None for the number of cpus
+    :param fps: Frames per second of the movie
+    :param chunk_frames: Number of consecutive frames a process draws at once
+    :return: frames per second that were drawn
+    """
+    processes = processes or os.cpu_count() or 1
+    sequence = "{" in output
+    if sequence and os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as directory:
+        if not isinstance(config.line_profiles, ProfileStore):
+            # A memory map that all processes share, instead of a copy of the grid for each of them
+            store = ProfileStore.from_array(os.path.join(directory, "profiles.npy"), config.line_profiles)
+            config = PlotConfig(ProfileStore(store.path), config.model_parameters, config.parameter_names,
+                                config.unique_params, config.line_names, config.figsize, config.dpi,
+                                config.extra_spectrum, **config.options)
+            del store
+
+        encoder = None if sequence else ffmpeg_process(output, config.frame_size, fps)
+        chunks = [(start, frames[start:start + chunk_frames]) for start in range(0, len(frames), chunk_frames)]
+        t0 = time.perf_counter()
+        with ProcessPoolExecutor(processes, initializer=init_worker, initargs=(config,)) as executor:
+            # Only a few chunks at a time, so the frames that wait for the encoder do not fill the memory
+            waiting = deque()
+            for start, chunk in chunks:
+                waiting.append(executor.submit(render_frames, start, chunk, output if sequence else None))
+                if len(waiting) >= 2 * processes:
+                    write_frames(waiting.popleft().result(), encoder)
+            while waiting:
+                write_frames(waiting.popleft().result(), encoder)
+        if encoder is not None:
+            encoder.stdin.close()
+            if encoder.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed with exit code {encoder.returncode}")
+        frame_rate = len(frames) / (time.perf_counter() - t0)
+    if verbose:
+        print(f"Drew {len(frames)} frames with {processes} processes, {frame_rate:.1f} frames per second")
+    return frame_rate
+
+
+def write_frames(results, encoder):
+    """Sends the pixels of the frames to ffmpeg (the image sequence is already saved by the workers)"""
+    if encoder is not None:
+        for rgba in results:
+            encoder.stdin.write(rgba)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Make a movie of the slider slide while one parameter moves.")
+    parser.add_argument("--parameter", default="a", help="The parameter that moves")
+    parser.add_argument("--steps", type=int, default=60, help="Number of frames from the lowest to the highest value")
+    parser.add_argument("--radio", default="None", help="Radio button to select (show all models of a parameter)")
+    parser.add_argument("--output", default="sweep_frames/frame_{:04d}.png",
+                        help="Image file name with {} for the frame number, or a movie file (needs ffmpeg)")
+    parser.add_argument("--processes", type=int, default=None, help="Number of processes, default: number of cpus")
+    parser.add_argument("--fps", type=int, default=30, help="Frames per second of the movie")
+    parser.add_argument("--dpi", type=int, default=80, help="Resolution of the frames, the figure is 16 x 9 inch")
+    args = parser.parse_args()
+
+    from the_talk import slider_slide_grid
+    grid = slider_slide_grid()
+    # Interpolated, so the sweep is smooth instead of jumping between the 5 grid values
+    config = PlotConfig(grid.line_profiles, grid.model_parameters, grid.parameter_names, grid.unique_params,
+                        grid.line_names, dpi=args.dpi, line_collection=True, interpolate=True)
+    index = grid.parameter_names.index(args.parameter)
+    start = {name: values[0] for name, values in zip(grid.parameter_names, grid.unique_params)}
+    values = grid.unique_params[index]
+    frames = sweep_path(start, args.parameter, np.linspace(values[0], values[-1], args.steps), back=True,
+                        radio=args.radio)
+    render_movie(config, frames, args.output, args.processes, args.fps)
@@ -1,7 +1,9 @@
 import numpy as np
 import matplotlib
 # Optional: Ensure right backend is in use. I like using Qt5Agg, must happen before importing pyplot...
-matplotlib.use("Qt5Agg")
+# Only when running the talk itself, so it can also be imported without a screen (e.g. by the benchmarks).
+if __name__ == "__main__":
+    matplotlib.use("Qt5Agg")
 import matplotlib.pyplot as plt
 print(f"You are using the {matplotlib.get_backend()} backend.")
 from matplotlib.widgets import RectangleSelector, TextBox
@@ -15,7 +17,10 @@ from anatomy_figure import AnatomyFigure
 import simple_nbody_sim as sns
 from random_figure_generator import make_random_figure
 from interactive_line_profiles import InteractivePlot
+from grid_builder import GridBuilder
 from ImageScatter import ImageScatter
+from theme_engine import ThemeEngine
+from slide_pool import SlidePool
 
 # Set to false if latex rendering is not an option.
 LATEX = True
@@ -23,9 +28,38 @@ LATEX = True
 # Lazy global fontsize for text on "normal" slides.
 fs = 30
 
-plt.rc("xtick", labelsize=15)
-plt.rc("ytick", labelsize=15)
-plt.rc("font", size=20)
+
+
+def set_base_style():
+    """The few style settings that are different from the matplotlib defaults."""
+    plt.rc("xtick", labelsize=15)
+    plt.rc("ytick", labelsize=15)
+    plt.rc("font", size=20)
+
+
+set_base_style()
+
+
+def slider_slide_grid():
+    """
+    The "line profiles" of the slider slide, every combination of a, b, c and d (cached on disk after the first time).
+    Also used by sweep_movie.py to make a movie of the slide.
+    :return: ModelGrid (grid_loader.py)
+    """
+    a = np.arange(1, 6, 1)
+    b = np.arange(1, 6, 1)
+    c = np.arange(1, 6, 1)
+    d = np.arange(1, 6, 1)
+    t = np.linspace(0, np.pi * 2, 600)
+
+    lines = [(r"cos($at$)", lambda t, a, b, c, d: (t, np.cos(a * t))),
+             (r"sin($bt$)", lambda t, a, b, c, d: (t, np.sin(b * t))),
+             (r"cos($ct$)", lambda t, a, b, c, d: (t, np.cos(c * t))),
+             (r"sin($dt$)", lambda t, a, b, c, d: (t, np.sin(d * t))),
+             (r"x = cos($at$) sin($bt$), y = cos($ct$)  sin($dt$)",
+              lambda t, a, b, c, d: (np.cos(a * t) * np.sin(b * t), np.cos(c * t) * np.sin(d * t)))]
+    return GridBuilder({"a": a, "b": b, "c": c, "d": d}, t, lines).build()
+
 
 # Check matplotlib version
 mpl_version = matplotlib.__version__
@@ -43,10 +77,13 @@ for have, need in zip(mpl_version.split("."), min_version.split(".")):
 
 class ThePresentation:
 
-    def __init__(self, start_slide=0, allow_latex=True):
+    def __init__(self, start_slide=0, allow_latex=True, show=True, keep_alive=False, keep_alive_bytes=500e6):
         """
         Initialize the figure and all corresponding required widgets, can determine the starting slide and if latex
         text rendering is allowed. Latex text rendering is more flexible and can look better but is quite a bit slower.
+        With show=False the figure is not shown, which is useful to run it without a screen (benchmarks and such).
+        With keep_alive=True slides are hidden rather than thrown away when you leave them, so going back is instant
+        and they are how you left them. keep_alive_bytes is roughly the maximum memory the hidden slides can use.
         """
         self.current_slide = start_slide
         self.allow_latex = allow_latex
@@ -54,6 +91,7 @@ class ThePresentation:
         self.latex = False
         self.serif = False
         self.fig = plt.figure(figsize=(16, 9))  # Typical screen aspect ratio.
+        self.theme = ThemeEngine(self.fig)  # Applies style changes to the slide without rebuilding it.
         self.switch_latex()
         self.switch_serif()
         self.ax = None
@@ -102,6 +140,14 @@ class ThePresentation:
                              self.update_hist9]
 
         self.textbox_axes = []
+        self.text_boxes = []
+        self.rulers = []  # Every ruler listens to resize events, until the slide is left
+
+        # Hidden slides that can be brought back as they were. The title slide is always restarted.
+        self.pool = SlidePool(self.fig, max_bytes=keep_alive_bytes, on_evict=self.release_slide) if keep_alive else None
+        self.not_pooled = [self.title_slide]
+        # The things that belong to a slide that need to come back with it
+        self.pooled_attributes = ["ax", "anafig", "fig_ax", "ax_selector", "text_boxes", "textbox_axes", "step"]
 
         # OPTIONAL: Have n bodies rotating in a orbit together.
         # n_points = 3
@@ -120,7 +166,8 @@ class ThePresentation:
         self.anim_substeps = 100
         self.slide_dict[self.current_slide]()
 
-        plt.show()
+        if show:
+            plt.show()
 
     def on_press(self, event):
         """
@@ -132,70 +179,39 @@ class ThePresentation:
         if event.inaxes in self.textbox_axes:
             return
         if event.key == "e":
-            self.switch_latex()
+            with self.theme.restyle():
+                self.switch_latex()
         elif event.key == "w":
-            self.switch_serif()
+            with self.theme.restyle():
+                self.switch_serif()
         elif event.key == "x":
-            self.switch_xkcd()
+            with self.theme.restyle():
+                self.switch_xkcd()
         elif event.key == "r":
             self.redraw_figure()
         elif event.key == "right":
-            self.step = 0
-            self.stop_animation()
-            if self.slide_dict[self.current_slide] == self.title_slide:
-                self.fig.canvas.mpl_disconnect(self.grav_click)
-                self.fig.canvas.mpl_disconnect(self.grav_release)
-
-            if self.slide_dict[self.current_slide] == self.slider_slide:
-                self.disconnect_sliders()
-            # elif self.slide_dict[self.current_slide - 1] == self.subplots_slide:
-            try:
-                self.fig.canvas.mpl_disconnect(self.ax_selector)
-            except AttributeError:
-                print("Nothing to disconnect!")
-
             if self.current_slide < len(self.slide_dict) - 1:
-                self.current_slide += 1
-                self.fig.clf()
-                self.slide_dict[self.current_slide]()
-
+                self.go_to_slide(self.current_slide + 1)
             else:
                 print("This is the last slide!")
 
         elif event.key == "left":
             if self.current_slide > 0:
-                self.step = 0
-                self.stop_animation()
-
-                if self.slide_dict[self.current_slide] == self.title_slide:
-                    self.fig.canvas.mpl_disconnect(self.grav_click)
-                    self.fig.canvas.mpl_disconnect(self.grav_release)
-
-                if self.slide_dict[self.current_slide] == self.slider_slide:
-                    self.disconnect_sliders()
-                # elif self.slide_dict[self.current_slide + 1] == self.subplots_slide:
-                try:
-                    self.fig.canvas.mpl_disconnect(self.ax_selector)
-                except AttributeError:
-                    print("Nothing to disconnect!")
-
-                self.fig.clf()
-                self.current_slide -= 1
-                self.slide_dict[self.current_slide]()
+                self.go_to_slide(self.current_slide - 1)
 
         elif event.key == " ":
             self.next_step()
 
         elif event.key == "z":
-            self.ruler = Ruler(self.fig)
+            self.add_ruler()
 
         elif event.key == "d":
-            if self.dark_theme:
-                plt.style.use("default")
-                self.fig.set_facecolor("white")
-            else:
-                plt.style.use("dark_background")
-                self.fig.set_facecolor("k")
+            # The theme engine also takes care of the figure background color
+            with self.theme.restyle():
+                if self.dark_theme:
+                    plt.style.use("default")
+                else:
+                    plt.style.use("dark_background")
 
             self.dark_theme = not self.dark_theme
         elif event.key in ["2", "3", "4", "5", "6", "7", "8", "9"]:
@@ -207,6 +223,121 @@ class ThePresentation:
         self.fig.canvas.draw()
         self.fig.canvas.flush_events()
 
+    def leave_slide(self, keep_alive=True):
+        """
+        Stops the animation and disconnects the widgets and such of the current slide, or hides the slide in the pool.
+        :param keep_alive: If False the slide is not kept in the pool, even if there is one.
+        """
+        self.stop_animation()
+
+        if self.slide_dict[self.current_slide] == self.title_slide:
+            self.fig.canvas.mpl_disconnect(self.grav_click)
+            self.fig.canvas.mpl_disconnect(self.grav_release)
+
+        if keep_alive and self.pool is not None and self.slide_dict[self.current_slide] not in self.not_pooled:
+            self.park_slide()
+        else:
+            self.disconnect_slide()
+        self.step = 0
+
+    def disconnect_slide(self):
+        """
+        Disconnects the widgets and such of the current slide.
+        """
+        if self.slide_dict[self.current_slide] == self.slider_slide:
+            self.disconnect_sliders()
+        try:
+            self.ax_selector.disconnect_events()
+            del self.ax_selector
+        except AttributeError:
+            print("Nothing to disconnect!")
+
+        for text_box in self.text_boxes:
+            text_box.disconnect_events()
+        self.text_boxes = []
+        self.textbox_axes = []
+
+        for ruler in self.rulers:
+            ruler.disconnect()
+        self.rulers = []
+        self.reset_slide_info(self.current_slide)
+
+    def reset_slide_info(self, slide):
+        """Let go of the things that are made again on the next visit anyway (the line profile grid is quite big)."""
+        if self.slide_dict[slide] == self.slider_slide:
+            self.slide_info[slide] = ()
+        elif self.slide_dict[slide] == self.histogram_example_slide:
+            self.slide_info[slide] = [[], [], []]
+        elif self.slide_dict[slide] == self.bird_plot:
+            self.slide_info[slide] = []
+
+    def slide_widgets(self):
+        """The matplotlib widgets on the current slide"""
+        widgets = list(self.text_boxes)
+        if hasattr(self, "ax_selector"):
+            widgets.append(self.ax_selector)
+        if self.slide_dict[self.current_slide] == self.slider_slide:
+            IP = self.slide_info[self.current_slide]
+            widgets += IP.sliders + [IP.radio_buttons]
+        return widgets
+
+    def park_slide(self):
+        """
+        Hides the current slide in the pool, with everything that is needed to bring it back.
+        """
+        attributes = {name: getattr(self, name) for name in self.pooled_attributes if hasattr(self, name)}
+        self.pool.park(self.current_slide, widgets=self.slide_widgets(), rulers=self.rulers, attributes=attributes,
+                       extra=self.slide_info[self.current_slide])
+        # These belong to the hidden slide now
+        self.text_boxes = []
+        self.textbox_axes = []
+        self.rulers = []
+        if hasattr(self, "ax_selector"):
+            del self.ax_selector
+
+    def restore_slide(self, slide):
+        """
+        Brings back a slide from the pool.
+        """
+        pooled = self.pool.restore(slide)
+        for name, value in pooled.attributes.items():
+            setattr(self, name, value)
+        self.rulers = pooled.rulers
+
+    def release_slide(self, slide, pooled):
+        """Called when the pool throws away a slide."""
+        print(f"Slide {slide} is no longer kept alive")
+        if self.slide_dict[slide] == self.slider_slide:
+            self.slide_info[slide].disconnect()
+        self.reset_slide_info(slide)
+
+    def clear_slide(self):
+        """
+        Removes the current slide from the figure, the hidden slides in the pool stay.
+        """
+        if self.pool is None:
+            self.fig.clf()
+        else:
+            self.pool.clear_unpooled()
+
+    def add_ruler(self):
+        """Adds the ruler background to the slide."""
+        self.ruler = Ruler(self.fig)
+        self.rulers.append(self.ruler)
+
+    def go_to_slide(self, slide):
+        """
+        Leaves the current slide, clears the figure and builds the requested slide.
+        :param slide: number of the slide to go to
+        """
+        self.leave_slide()
+        self.clear_slide()
+        self.current_slide = slide
+        if self.pool is not None and slide in self.pool:
+            self.restore_slide(slide)
+        else:
+            self.slide_dict[self.current_slide]()
+
     def stop_animation(self):
         """
         Lazy animation stopper. Only works if the animation is saved on self.ani of course.
@@ -220,11 +351,7 @@ class ThePresentation:
     def disconnect_sliders(self):
         """Dist connects the sliders"""
         IP = self.slide_info[self.current_slide]
-        buttons = IP.radio_buttons
-        sliders = IP.sliders
-        self.fig.canvas.mpl_disconnect(buttons)
-        for slider in sliders:
-            self.fig.canvas.mpl_disconnect(slider)
+        IP.disconnect()
         for ax in IP.axarr:
             ax.remove()
         for ax in IP.sliderAxes:
@@ -247,7 +374,7 @@ class ThePresentation:
                 self.anafig.add_technical_points()
         elif self.slide_dict[self.current_slide] == self.figsize_slide:
             if self.step == 1:
-                self.ruler = Ruler(self.fig)
+                self.add_ruler()
         elif self.slide_dict[self.current_slide] == self.histogram_example_slide:
             if self.step <= 9:
                 self.hist_updates[self.step - 1]()
@@ -263,8 +390,8 @@ class ThePresentation:
         print(f"Redrawing slide number: {self.current_slide}")
         print(f"Using LateX: {self.latex}")
         print(f"Using serif fonts: {self.serif}")
-        self.stop_animation()
-        plt.clf()
+        self.leave_slide(keep_alive=False)
+        self.clear_slide()
         self.slide_dict[self.current_slide]()
 
     def switch_latex(self):
@@ -300,9 +427,7 @@ class ThePresentation:
         if self.xkcd:
             # plt.rcParams = copy.deepcopy(default_rc)
             matplotlib.style.use("default")
-            plt.rc("xtick", labelsize=15)
-            plt.rc("ytick", labelsize=15)
-            plt.rc("font", size=20)
+            set_base_style()
             plt.rcParams['text.usetex'] = self.latex
 
             if self.serif:
@@ -320,7 +445,7 @@ class ThePresentation:
         Just the title slide
         :return:
         """
-        self.ax = plt.subplot(1, 1, 1)
+        self.ax = self.fig.add_subplot(1, 1, 1)
         self.ax.text(0.5, 0.85, "Matplotlib, why it is pretty decent", fontsize=25,
                      transform=self.ax.transAxes, ha="center")
         self.fig.subplots_adjust(0.0, 0.0, 1, 1)
@@ -352,10 +477,14 @@ class ThePresentation:
         self.ani = animation.FuncAnimation(self.fig, self.animate_grav, interval=1, blit=True)
 
 
+    def toolbar_idle(self):
+        """Checks that the toolbar is not busy zooming or panning. (There is no toolbar without a screen.)"""
+        toolbar = self.fig.canvas.toolbar
+        return toolbar is None or toolbar.mode == ""
+
     def add_grav_particle1(self, event):
         """Initiates the adding of a particle in the N-body simulator"""
-        toolbar = plt.get_current_fig_manager().toolbar
-        if event.button == 1 and toolbar.mode == "" and event.key != "shift" and event.inaxes == self.ax:
+        if event.button == 1 and self.toolbar_idle() and event.key != "shift" and event.inaxes == self.ax:
             x = event.xdata
             y = event.ydata
             self.click_loc = (x, y)
@@ -363,8 +492,7 @@ class ThePresentation:
     def add_grav_particle2(self, event):
         """ Adds a new particle in the N-body simulator, the difference in click location and release location affects
          the velocity of the particle. """
-        toolbar = plt.get_current_fig_manager().toolbar
-        if event.button == 1 and toolbar.mode == "" and event.key != "shift" and event.inaxes == self.ax:
+        if event.button == 1 and self.toolbar_idle() and event.key != "shift" and event.inaxes == self.ax:
             x = event.xdata
             y = event.ydata
             x2, y2 = self.click_loc
@@ -538,7 +666,7 @@ class ThePresentation:
         #     self.switch_serif()
 
         # include the ruler
-        self.ruler = Ruler(self.fig)
+        self.add_ruler()
 
         # self.ax.text(0.1, 0.7, r"\texttt{figsize=(<Width>, <Height>)}", transform=self.ax.transAxes, fontsize=40)
         self.fig.text(0.5, 0.85, r"\texttt{figsize=(<Width>, <Height>)}", fontsize=fs * 1.5, zorder=-1, ha="center")
@@ -561,7 +689,7 @@ class ThePresentation:
         Slide that allows drawing in subpplots
         :return:
         """
-        self.ruler = Ruler(self.fig)
+        self.add_ruler()
 
         # A bit of code that allows you to draw in new Axes
         self.fig_ax = self.fig.add_axes([0, 0, 1, 1], zorder=100)
@@ -985,36 +1113,11 @@ class ThePresentation:
         if self.serif:
             self.switch_serif()
 
-        # Generate "line profiles"
-        a = np.arange(1, 6, 1)
-        b = np.arange(1, 6, 1)
-        c = np.arange(1, 6, 1)
-        d = np.arange(1, 6, 1)
-        t = np.linspace(0, np.pi * 2, 600)
-
-        param_vals = []
-        line_profiles = []
-
-        for ai in a:
-            for bi in b:
-                for ci in c:
-                    for di in d:
-                        param_vals.append([ai, bi, ci, di])
-                        line_profiles.append([])
-                        line_profiles[-1].append([t, np.cos(ai * t)])
-                        line_profiles[-1].append([t, np.sin(bi * t)])
-                        line_profiles[-1].append([t, np.cos(ci * t)])
-                        line_profiles[-1].append([t, np.sin(di * t)])
-                        line_profiles[-1].append([np.cos(ai * t) * np.sin(bi * t),
-                                                  np.cos(ci * t) * np.sin(di * t)])
-
-        param_vals = np.array(param_vals)
-        line_profiles = np.array(line_profiles)
-
-        line_names = [r"cos($at$)", r"sin($bt$)", r"cos($ct$)", r"sin($dt$)",
-                      r"x = cos($at$) sin($bt$), y = cos($ct$)  sin($dt$)"]
-        slider_plot = InteractivePlot(self.fig, line_profiles, param_vals,
-                 ["a", "b", "c", "d"], [a, b, c, d], line_names)
+        grid = slider_slide_grid()
+
+        slider_plot = InteractivePlot(self.fig, grid.line_profiles, grid.model_parameters,
+                 grid.parameter_names, grid.unique_params, grid.line_names, coalesce_updates=True, blit=True,
+                 line_collection=True)
 
         self.slide_info[self.current_slide] = slider_plot
         slider_plot.init_plot()
@@ -1132,5 +1235,14 @@ if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--ss", type=int, default=0, help="Start slide of the presentation")
+    parser.add_argument("--keep-alive", action="store_true", help="Keep visited slides alive (uses more memory)")
+    parser.add_argument("--record", default=None, help="Record the key presses and clicks to this file (json), "
+                                                       "they can be replayed with replay_navigation.py")
     args = parser.parse_args()
-    pres = ThePresentation(start_slide=args.ss, allow_latex=LATEX)
+    if args.record is None:
+        pres = ThePresentation(start_slide=args.ss, allow_latex=LATEX, keep_alive=args.keep_alive)
+    else:
+        from replay_navigation import EventRecorder
+        pres = ThePresentation(start_slide=args.ss, allow_latex=LATEX, show=False, keep_alive=args.keep_alive)
+        recorder = EventRecorder(pres.fig, args.record, start_slide=args.ss)
+        plt.show()
@@ -0,0 +1,168 @@
+"""
+Applies changed style settings (rcParams) to the artists that are already on a figure. Matplotlib only reads most
+rcParams when an artist is created, so normally a change of style needs the whole figure to be rebuilt. This walks
+the artists instead and swaps the old style values for the new ones, so toggling dark mode and such is quick.
+"""
+import contextlib
+import numpy as np
+import matplotlib
+from matplotlib.colors import to_rgba
+from matplotlib.text import Text
+
+
+# The rcParams that are re-applied to existing artists. Everything else still needs an "r" redraw.
+THEMED_PARAMS = ["figure.facecolor", "figure.edgecolor",
+                 "axes.facecolor", "axes.edgecolor", "axes.labelcolor", "axes.titlecolor",
+                 "text.color", "xtick.color", "ytick.color", "xtick.labelcolor", "ytick.labelcolor",
+                 "grid.color", "legend.facecolor", "legend.edgecolor",
+                 "font.family", "text.usetex", "path.sketch", "path.effects"]
+
+
+def same_color(c1, c2):
+    """Checks if two matplotlib colors are the same, anything that is not a valid color is never the same."""
+    try:
+        return np.allclose(to_rgba(c1), to_rgba(c2))
+    except (ValueError, TypeError):
+        return False
+
+
+class ThemeEngine:
+    """
+    Re-styles the artists of a figure after the rcParams have been changed.
+    Only artists that still have the old default value are changed, so things that were given an explicit
+    color or font keep it.
+
+    Usage:
+    theme = ThemeEngine(fig)
+    with theme.restyle():
+        plt.style.use("dark_background")
+    fig.canvas.draw_idle()
+    """
+
+    def __init__(self, fig):
+        self.fig = fig
+
+    @staticmethod
+    def snapshot():
+        """
+        Stores the current values of the themed rcParams.
+        :return: dictionary with the rcParams
+        """
+        return {key: matplotlib.rcParams[key] for key in THEMED_PARAMS if key in matplotlib.rcParams}
+
+    @contextlib.contextmanager
+    def restyle(self):
+        """
+        Context manager that takes a snapshot of the style before and applies the differences afterwards.
+        """
+        old_rc = self.snapshot()
+        yield
+        self.apply(old_rc)
+
+    @staticmethod
+    def resolve(rc):
+        """
+        Resolves the rcParams that refer to other rcParams ("inherit", "auto", ...)
+        :param rc: dictionary with rcParams as made by snapshot
+        :return: new dictionary with only actual values
+        """
+        rc = dict(rc)
+        if rc.get("axes.titlecolor", "auto") == "auto":
+            rc["axes.titlecolor"] = rc["text.color"]
+        for axis in ["xtick", "ytick"]:
+            if rc.get(f"{axis}.labelcolor", "inherit") == "inherit":
+                rc[f"{axis}.labelcolor"] = rc[f"{axis}.color"]
+        if rc["legend.facecolor"] == "inherit":
+            rc["legend.facecolor"] = rc["axes.facecolor"]
+        if rc["legend.edgecolor"] == "inherit":
+            rc["legend.edgecolor"] = rc["axes.edgecolor"]
+        return rc
+
+    def apply(self, old_rc):
+        """
+        Applies the difference between old_rc and the current rcParams to all artists on the figure.
+        Does not redraw the figure, that is up to the caller.
+        :param old_rc: dictionary with rcParams as made by snapshot
+        :return: the names of the rcParams that changed
+        """
+        old = self.resolve(old_rc)
+        new = self.resolve(self.snapshot())
+        changed = [key for key in old if not self.same_value(old[key], new[key])]
+        if not changed:
+            return changed
+
+        def recolor(getter, setter, key):
+            if key in changed and same_color(getter(), old[key]):
+                setter(new[key])
+
+        patch = self.fig.patch
+        recolor(patch.get_facecolor, patch.set_facecolor, "figure.facecolor")
+        recolor(patch.get_edgecolor, patch.set_edgecolor, "figure.edgecolor")
+
+        for ax in self.fig.axes:
+            recolor(ax.patch.get_facecolor, ax.patch.set_facecolor, "axes.facecolor")
+            for spine in ax.spines.values():
+                recolor(spine.get_edgecolor, spine.set_edgecolor, "axes.edgecolor")
+            recolor(ax.title.get_color, ax.title.set_color, "axes.titlecolor")
+            for axis, name in [(ax.xaxis, "x"), (ax.yaxis, "y")]:
+                recolor(axis.label.get_color, axis.label.set_color, "axes.labelcolor")
+                self.apply_ticks(ax, axis, name, old, new, changed)
+
+        legends = list(self.fig.legends) + [ax.get_legend() for ax in self.fig.axes if ax.get_legend()]
+        for legend in legends:
+            frame = legend.get_frame()
+            recolor(frame.get_facecolor, frame.set_facecolor, "legend.facecolor")
+            recolor(frame.get_edgecolor, frame.set_edgecolor, "legend.edgecolor")
+
+        # Everything else that is text: regular texts, tick labels, legend labels etc.
+        for text in self.fig.findobj(Text):
+            recolor(text.get_color, text.set_color, "text.color")
+            if "font.family" in changed and list(text.get_fontfamily()) == list(old["font.family"]):
+                text.set_fontfamily(new["font.family"])
+            if "text.usetex" in changed and text.get_usetex() == old["text.usetex"]:
+                text.set_usetex(new["text.usetex"])
+
+        # The xkcd look is mostly sketchy lines with a white outline
+        if "path.sketch" in changed or "path.effects" in changed:
+            for artist in self.fig.findobj():
+                if "path.sketch" in changed and artist.get_sketch_params() == old["path.sketch"]:
+                    if new["path.sketch"] is None:
+                        artist.set_sketch_params(None)
+                    else:
+                        artist.set_sketch_params(*new["path.sketch"])
+                if "path.effects" in changed and list(artist.get_path_effects()) == list(old["path.effects"]):
+                    artist.set_path_effects(list(new["path.effects"]))
+
+        self.fig.stale = True
+        return changed
+
+    @staticmethod
+    def apply_ticks(ax, axis, name, old, new, changed):
+        """
+        Updates the colors of the ticks, tick labels and grid lines of one axis. Done through tick_params, so ticks
+        that are created later on also get the new colors.
+        """
+        ticks = axis.get_major_ticks()
+        if not ticks:
+            return
+        tick = ticks[0]
+        kwargs = {}
+        if f"{name}tick.color" in changed and same_color(tick.tick1line.get_color(), old[f"{name}tick.color"]):
+            kwargs["color"] = new[f"{name}tick.color"]
+        if f"{name}tick.labelcolor" in changed and same_color(tick.label1.get_color(),
+                                                              old[f"{name}tick.labelcolor"]):
+            kwargs["labelcolor"] = new[f"{name}tick.labelcolor"]
+        if "grid.color" in changed and same_color(tick.gridline.get_color(), old["grid.color"]):
+            kwargs["grid_color"] = new["grid.color"]
+        if kwargs:
+            ax.tick_params(axis=name, which="both", **kwargs)
+
+    @staticmethod
+    def same_value(val1, val2):
+        """Compares rcParam values, which can be strings, lists, tuples, None, ..."""
+        if isinstance(val1, (list, tuple)) and isinstance(val2, (list, tuple)):
+            return list(val1) == list(val2)
+        if isinstance(val1, str) and isinstance(val2, str) and val1 != val2:
+            # Different names can still be the same color ("k" and "black")
+            return same_color(val1, val2)
+        return val1 == val2